@@ -1,69 +1,335 @@
 import bpy
-from . import helper
+import time
+import zlib
+import numpy as np
+from . import helper, profiling
+
+# decimation ratios of the cached levels, finest first
+freezeRatios = (0.5, 0.25, 0.1, 0.02)
+
+# cheap checksum of the mesh, used to tell whether the cached levels are still valid
+def meshFingerprint(mesh):
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    return "%d:%d:%08x" % (len(mesh.vertices), len(mesh.polygons), zlib.crc32(co.tobytes()))
+
+def levelNames(mesh):
+    names = mesh.get("freezeLevels", "")
+    return names.split("\n") if names else []
+
+# returns the decimated levels of the object's mesh, building them only if the mesh has changed since the last freeze
+@profiling.stage("levels")
+def freezeLevels(ob):
+    source = ob.data
+    fingerprint = meshFingerprint(source)
+    levels = [bpy.data.meshes.get(name) for name in levelNames(source)]
+    if levels and None not in levels and source.get("freezeFingerprint") == fingerprint:
+        return levels
+
+    # stale cache
+    releaseLevels(source)
+
+    # only the decimation should end up in the levels
+    disabled = [md for md in ob.modifiers if md.show_viewport]
+    for md in disabled:
+        md.show_viewport = False
+
+    md = ob.modifiers.new('BoolDecimate', 'DECIMATE')
+    levels = []
+    prevRatio = 1.0
+    for i, ratio in enumerate(freezeRatios):
+        # each level is decimated from the previous one, which is a lot cheaper than starting from the source
+        md.ratio = ratio / prevRatio
+        helper.counters['to_mesh'] += 1
+        level = ob.to_mesh(bpy.context.scene, True, 'PREVIEW', calc_tessface=False)
+        level.name = "%s_LOD%d" % (source.name, i)
+        levels.append(level)
+        ob.data = level
+        prevRatio = ratio
+
+    ob.modifiers.remove(md)
+    ob.data = source
+    for md in disabled:
+        md.show_viewport = True
+
+    source["freezeLevels"] = "\n".join(level.name for level in levels)
+    source["freezeFingerprint"] = fingerprint
+    return levels
+
+# Removes the levels nothing uses any more, once they are stale. The levels have no fake user, so they are not
+# saved with the file and a level that isn't shown is gone after a reload, which freezeLevelUpdate and freezeLevels
+# both expect
+def releaseLevels(source):
+    inUse = False
+    for name in levelNames(source):
+        level = bpy.data.meshes.get(name)
+        if level is None:
+            continue
+        if level.users == 0:
+            bpy.data.meshes.remove(level)
+        else:
+            inUse = True
+    # another frozen object with the same mesh still uses them
+    if not inUse:
+        for key in ("freezeLevels", "freezeFingerprint"):
+            if key in source:
+                del source[key]
+
+# finest level that fits into the face budget
+def levelForBudget(levels, faceBudget):
+    for i, level in enumerate(levels):
+        if len(level.polygons) <= faceBudget:
+            return i
+    return len(levels)-1
+
+# update callback of Object.freeze_level, swaps in the cached mesh of the chosen level
+def freezeLevelUpdate(self, context):
+    if not self.frozen:
+        return
+    source = bpy.data.meshes.get(self.get("freezeSource", ""))
+    if source is None:
+        return
+    names = levelNames(source)
+    if not names:
+        return
+    level = bpy.data.meshes.get(names[min(self.freeze_level, len(names)-1)])
+    if level is not None and self.data != level:
+        self.data = level
+
+# the hidden full resolution object stored for a frozen object
+def frozenOriginal(ob):
+    original = bpy.data.objects.get(ob.get("frozenOriginal", ""))
+    if original is not None and original.parent == ob:
+        return original
+    
+    # the stored object was renamed, look for it among the children
+    source = bpy.data.meshes.get(ob.get("freezeSource", ""))
+    for child in ob.children:
+        if child.data == source:
+            ob["frozenOriginal"] = child.name
+            return child
+    return None
+
+def freezeObject(ob, faceBudget):
+    if "Frozen" not in bpy.data.groups:
+        bpy.data.groups.new("Frozen")
+
+    source = ob.data
+    levels = freezeLevels(ob)
+
+    # the hidden copy keeps the full resolution mesh, no need to copy the mesh itself
+    obCopy = ob.copy()
+    bpy.context.scene.objects.link(obCopy)
+    obCopy.parent = ob
+    obCopy.matrix_parent_inverse = ob.matrix_world.inverted()
+    obCopy.name = "Frozen_"+ob.name
+    obCopy.hide = True
+    obCopy.hide_select = True
+
+    # index of the frozen pair, saved with the file
+    ob["frozenOriginal"] = obCopy.name
+    ob["freezeSource"] = source.name
+    ob.frozen = True
+    ob.freeze_level = levelForBudget(levels, faceBudget)
+    ob.data = levels[ob.freeze_level]
+    ob.hide_render = True
+    bpy.data.groups['Frozen'].objects.link(ob)
+
+# returns False and leaves the object frozen when its full resolution mesh can't be found
+def unfreezeObject(ob):
+    original = frozenOriginal(ob)
+    if original is not None:
+        source = original.data
+    else:
+        # the hidden object is gone, the mesh may still be there
+        source = bpy.data.meshes.get(ob.get("freezeSource", ""))
+        if source is None:
+            return False
+    
+    ob.data = source
+    if original is not None:
+        bpy.context.scene.objects.unlink(original)
+        bpy.data.objects.remove(original)
+    # the levels stay for the session, so freezing again doesn't decimate again
+
+    ob.hide_render = False
+
+    if "Frozen" in bpy.data.groups and ob.name in bpy.data.groups['Frozen'].objects:
+        bpy.data.groups['Frozen'].objects.unlink(ob)
+
+    for key in ("frozenOriginal", "freezeSource", "freezeGovernor"):
+        if key in ob:
+            del ob[key]
+    ob.frozen = False
+    return True
 
 class BooleanFreezeOperator(bpy.types.Operator):
-    '''Decimates the object temporarily for viewport performance'''
+    '''Decimates the selected objects temporarily for viewport performance'''
     bl_idname = "boolean.freeze"
     bl_label = "Boolean Freeze"
     bl_options = {'REGISTER', 'UNDO'}
 
     @classmethod
     def poll(cls, context):
-        return context.active_object is not None and len(bpy.context.selected_objects)==1 and context.active_object.frozen == False
+        return context.active_object is not None and any(obj.type == 'MESH' and not obj.frozen for obj in context.selected_objects)
 
     def execute(self, context):
-        
-        if "Frozen" not in bpy.data.groups:
-            bpy.data.groups.new("Frozen")
-        
-        ob = context.active_object
-        obCopy = helper.objDuplicate(ob)
-        md = ob.modifiers.new('BoolDecimate', 'DECIMATE')
-        md.ratio = 0.1
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier="BoolDecimate")
-        ob.hide_render = True
-        obCopy.select = True
-        bpy.ops.object.parent_set(type='OBJECT', keep_transform=False)
-        obCopy.name = "Frozen_"+ob.name
-        obCopy.hide = True
-        obCopy.hide_select = True
-        obCopy.select = False
-        ob.select = True
-        bpy.ops.object.group_link(group='Frozen')
-        ob.frozen = True
-        
+        helper.modeSet('OBJECT')
+
+        faceBudget = context.window_manager.freezeFaceBudget
+        for SelectedObject in context.selected_objects:
+            if SelectedObject.type == 'MESH' and not SelectedObject.frozen:
+                freezeObject(SelectedObject, faceBudget)
+
         return {'FINISHED'}
-        
+
 class BooleanUnfreezeOperator(bpy.types.Operator):
-    '''Decimates the object temporarily for viewport performance'''
+    '''Restores the full resolution of the selected frozen objects'''
     bl_idname = "boolean.unfreeze"
     bl_label = "Boolean Unfreeze"
     bl_options = {'REGISTER', 'UNDO'}
 
     @classmethod
     def poll(cls, context):
-        return context.active_object is not None and len(bpy.context.selected_objects)==1 and context.active_object.frozen == True
+        return context.active_object is not None and any(obj.frozen for obj in context.selected_objects)
 
     def execute(self, context):
-        ob = bpy.context.active_object
-        
-        for sceneObj in bpy.context.scene.objects:
-            if sceneObj.parent == ob:
-                frozen = sceneObj
-        
-        remname = ob.data.name
-        
-        ob.data = bpy.context.scene.objects['Frozen_'+ob.name].data
-        
-        bpy.data.scenes[bpy.context.scene.name].objects.unlink(frozen)
-        bpy.data.objects.remove(frozen)
-        # remove mesh to prevent memory being cluttered up with hundreds of high-poly objects
-        bpy.data.meshes.remove(bpy.data.meshes[remname])
-        
-        ob.hide_render = False
-        
-        bpy.data.groups['Frozen'].objects.unlink(bpy.context.object)
-        
-        ob.frozen = False
-        
-        return {'FINISHED'}
\ No newline at end of file
+        lost = [SelectedObject.name for SelectedObject in context.selected_objects
+                if SelectedObject.frozen and not unfreezeObject(SelectedObject)]
+        if lost:
+            self.report({'WARNING'}, "Full resolution mesh not found, left frozen: %s" % ", ".join(lost))
+
+        return {'FINISHED'}
+
+# The governor keeps the faces of the visible objects under the scene budget by freezing the objects
+# that were edited longest ago. It only unfreezes once there is room to spare, and leaves an object
+# alone for a while after it touched it, so it never goes back and forth
+governorInterval = 1.0
+governorMargin = 0.8
+governorHold = 5.0
+
+# time of the last data edit per object, kept by the scene update handler
+lastEdit = {}
+lastData = {}
+# when the governor last froze or unfroze the object
+lastGoverned = {}
+# evaluated face counts by object, with the state they were counted in
+faceCache = {}
+# whether the governor is running. Not a property, so it isn't saved with the file
+governorRunning = False
+
+# scene update handler, only installed while the governor runs. Not persistent, loading a file removes it
+def trackEdits(scene):
+    if not bpy.data.objects.is_updated:
+        return
+    now = time.time()
+    for ob in scene.objects:
+        if ob.type == 'MESH' and ob.is_updated_data:
+            # freezing swaps the mesh, which isn't an edit
+            if lastData.get(ob.name) == ob.data.name:
+                lastEdit[ob.name] = now
+            lastData[ob.name] = ob.data.name
+
+# faces of the object with its modifiers
+def evaluatedFaces(ob, scene):
+    if not any(md.show_viewport for md in ob.modifiers):
+        return len(ob.data.polygons)
+    state = (ob.data.name, len(ob.data.polygons), len(ob.modifiers), lastEdit.get(ob.name))
+    cached = faceCache.get(ob.name)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    helper.counters['to_mesh'] += 1
+    mesh = ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=False)
+    faces = len(mesh.polygons)
+    bpy.data.meshes.remove(mesh)
+    faceCache[ob.name] = (state, faces)
+    return faces
+
+def governorTrack(on):
+    handlers = bpy.app.handlers.scene_update_post
+    if on and trackEdits not in handlers:
+        handlers.append(trackEdits)
+    elif not on and trackEdits in handlers:
+        handlers.remove(trackEdits)
+
+# loading a file ends the governor's modal handler without a word, the flag has to follow
+@bpy.app.handlers.persistent
+def governorReset(dummy):
+    global governorRunning
+    governorRunning = False
+    governorTrack(False)
+
+def governorFrozen(ob):
+    return ob.frozen and ob.get("freezeGovernor", False)
+
+def govern(context):
+    scene = context.scene
+    wm = context.window_manager
+    now = time.time()
+    active = context.active_object
+    if active is not None:
+        lastEdit[active.name] = now
+    
+    objects = [ob for ob in scene.objects if ob.type == 'MESH' and ob.is_visible(scene)]
+    faces = dict((ob.name, evaluatedFaces(ob, scene)) for ob in objects)
+    total = sum(faces.values())
+    settled = lambda ob: now - lastGoverned.get(ob.name, 0.0) > governorHold
+    
+    # selecting a frozen object brings it back
+    for ob in objects:
+        if governorFrozen(ob) and ob.select and unfreezeObject(ob):
+            lastEdit[ob.name] = lastGoverned[ob.name] = now
+            total += evaluatedFaces(ob, scene) - faces[ob.name]
+    
+    if total > wm.freezeGovernorBudget:
+        candidates = [ob for ob in objects if not ob.frozen and not ob.select and ob != active and settled(ob)]
+        candidates.sort(key=lambda ob: lastEdit.get(ob.name, 0.0))
+        for ob in candidates:
+            if total <= wm.freezeGovernorBudget:
+                break
+            freezeObject(ob, wm.freezeFaceBudget)
+            ob["freezeGovernor"] = True
+            lastGoverned[ob.name] = now
+            total += evaluatedFaces(ob, scene) - faces[ob.name]
+        return
+    
+    # unfreeze the most recently edited object if it fits well within the budget
+    frozen = [ob for ob in objects if governorFrozen(ob) and settled(ob)]
+    frozen.sort(key=lambda ob: -lastEdit.get(ob.name, 0.0))
+    for ob in frozen:
+        original = frozenOriginal(ob)
+        if original is None:
+            continue
+        extra = evaluatedFaces(original, scene) - faces[ob.name]
+        if total + extra <= wm.freezeGovernorBudget * governorMargin:
+            unfreezeObject(ob)
+            lastGoverned[ob.name] = now
+            return
+
+class FreezeGovernorOperator(bpy.types.Operator):
+    '''Freezes and unfreezes objects on its own to keep the visible faces under the scene budget. Run again to stop'''
+    bl_idname = "boolean.freeze_governor"
+    bl_label = "Freeze Governor"
+
+    def invoke(self, context, event):
+        global governorRunning
+        wm = context.window_manager
+        if governorRunning:
+            # the running instance stops on its next tick
+            governorRunning = False
+            return {'FINISHED'}
+        governorRunning = True
+        governorTrack(True)
+        self.timer = wm.event_timer_add(governorInterval, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if not governorRunning:
+            context.window_manager.event_timer_remove(self.timer)
+            governorTrack(False)
+            return {'CANCELLED'}
+        # the active object is never touched, so this is safe in any mode
+        if event.type == 'TIMER':
+            govern(context)
+        return {'PASS_THROUGH'}
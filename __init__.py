@@ -13,14 +13,17 @@ bl_info = {
 if "bpy" in locals():
     import imp
     imp.reload(helper)
+    imp.reload(profiling)
     imp.reload(booleanOps)
     imp.reload(greaseTrim)
     imp.reload(meshExtract)
     imp.reload(utilOps)
     imp.reload(Freeze)
+    imp.reload(smooth)
+    imp.reload(strokeCut)
     print("Reloaded multifiles")
 else:
-    from . import helper, booleanOps, greaseTrim, meshExtract, utilOps, Freeze
+    from . import helper, profiling, smooth, strokeCut, booleanOps, greaseTrim, meshExtract, utilOps, Freeze
     print("Imported multifiles")
     
 import bpy
@@ -44,13 +47,12 @@ class RemeshBooleanPanel(bpy.types.Panel):
         row_rem = layout.row(align=True)
         row_rem.alignment = 'EXPAND'
         row_rem.operator("sculpt.remesh", text='Remesh')
+        row_rem.operator("sculpt.remesh_background", text='Background')
         
-        row_remint = layout.row(align=True)
-        row_remint.alignment = 'EXPAND'
+        col_remint = layout.column(align=True)
 
         try:
-            row_remint.prop(wm, 'remeshDepthInt', text="Depth")
-            row_remint.prop(wm, 'remeshSubdivisions', text="Subdivisions")
+            utilOps.remeshDrawSettings(col_remint, context.active_object, wm)
             
         except:
             pass
@@ -64,6 +66,17 @@ class RemeshBooleanPanel(bpy.types.Panel):
         row_freeze.alignment = 'EXPAND'        
         row_freeze.operator("boolean.freeze", text="Freeze")
         row_freeze.operator("boolean.unfreeze", text="Unfreeze")
+        
+        row_freeze2 = layout.row(align=True)
+        row_freeze2.alignment = 'EXPAND'
+        row_freeze2.prop(wm, 'freezeFaceBudget', text="Face Budget")
+        if context.active_object is not None and context.active_object.frozen:
+            row_freeze2.prop(context.active_object, 'freeze_level', text="Level")
+        
+        row_freeze3 = layout.row(align=True)
+        row_freeze3.alignment = 'EXPAND'
+        row_freeze3.operator("boolean.freeze_governor", text="Stop Governor" if Freeze.governorRunning else "Governor", depress=Freeze.governorRunning)
+        row_freeze3.prop(wm, 'freezeGovernorBudget', text="Scene Budget")
         layout.separator()
 
         row_b1 = layout.row(align=True)
@@ -72,6 +85,11 @@ class RemeshBooleanPanel(bpy.types.Panel):
         row_b1.operator("boolean.difference", text="Difference")
         row_b1.operator("boolean.intersect", text="Intersect")
         
+        row_bb = layout.row(align=True)
+        row_bb.alignment = 'EXPAND'
+        row_bb.prop(wm, 'booleanBatch', text="Balanced Tree")
+        row_bb.prop(wm, 'booleanLocal', text="Localized")
+        
         row_b2 = layout.row(align=True)
         row_b2.alignment = 'EXPAND'
         
@@ -99,6 +117,9 @@ class RemeshBooleanPanel(bpy.types.Panel):
         row_mir = layout.row(align=True)
         row_mir.alignment = 'EXPAND'
         row_mir.operator("boolean.mod_xmirror", text="X-mirror")
+        row_mir.prop(wm, "xmirrorModeEnum", text="")
+        if wm.xmirrorModeEnum == 'INSTANCE':
+            row_mir.operator("boolean.xmirror_realize", text="Realize")
         
         row_me_oprow = layout.row(align=True)
         row_me_oprow.alignment = 'EXPAND'
@@ -123,6 +144,15 @@ class RemeshBooleanPanel(bpy.types.Panel):
             box.separator()                                         
             box.operator("boolean.purge_pencils", text='Purge All Grease Pencils')
         
+        box = layout.box().column(align=True)
+        if wm.expand_profile == False: 
+            box.prop(wm, "expand_profile", icon="TRIA_RIGHT", icon_only=True, text=" Profiling", emboss=False)
+        else:
+            box.prop(wm, "expand_profile", icon="TRIA_DOWN", icon_only=True, text=" Profiling", emboss=False)
+            box.separator()
+            box.prop(wm, "profileOperators", text="Profile Operators")
+            profiling.drawRuns(box)
+        
 
         
 class BooleanOpsMenu(bpy.types.Menu):
@@ -169,6 +199,8 @@ class BooleanOpsMenu(bpy.types.Menu):
         
 
 def register():
+    for module in (booleanOps, utilOps, meshExtract, greaseTrim, Freeze):
+        profiling.instrumentModule(module)
     bpy.utils.register_module(__name__)
     
     kc = bpy.context.window_manager.keyconfigs.addon
@@ -188,10 +220,28 @@ def register():
         kmi = km.keymap_items.new('sculpt.dynamic_topology_toggle', 'D', 'PRESS', shift = True)
 
     bpy.types.Object.frozen = BoolProperty(name="frozen", default = False)
+    bpy.types.Object.freeze_level = IntProperty(name="freeze_level", min = 0, max = len(Freeze.freezeRatios)-1, default = 0, update = Freeze.freezeLevelUpdate)
+    bpy.types.WindowManager.freezeFaceBudget = IntProperty(min = 1000, default = 100000)
+    bpy.types.WindowManager.freezeGovernorBudget = IntProperty(min = 10000, default = 2000000)
+    bpy.app.handlers.load_post.append(Freeze.governorReset)
         
     bpy.types.WindowManager.remeshDepthInt = IntProperty(min = 2, max = 10, default = 4)
     bpy.types.WindowManager.remeshSubdivisions = IntProperty(min = 0, max = 6, default = 0)
     bpy.types.WindowManager.remeshPreserveShape = BoolProperty(default = True)
+    bpy.types.WindowManager.remeshModeEnum = EnumProperty(name="Remesh mode",
+                     items = (("DEPTH","Octree Depth",""),
+                              ("FACES","Target Face Count",""),
+                              ("DETAIL","Detail Size","")),
+                     default = "DEPTH")
+    bpy.types.WindowManager.remeshTargetFaces = IntProperty(min = 1000, max = 50000000, default = 200000)
+    bpy.types.WindowManager.remeshDetailSize = FloatProperty(min = 0.0001, max = 100.0, default = 0.02)
+    
+    bpy.types.WindowManager.booleanBatch = BoolProperty(default = False)
+    bpy.types.WindowManager.booleanLocal = BoolProperty(default = False)
+    bpy.types.WindowManager.xmirrorModeEnum = EnumProperty(name="X-mirror mode",
+                     items = (("MODIFIER","Modifier","Add a mirror modifier to every selected object"),
+                              ("INSTANCE","Instance","Add a mirrored copy sharing the mesh of every selected object, shown without modifiers")),
+                     default = "MODIFIER")
 
     bpy.types.WindowManager.extractDepthFloat = FloatProperty(min = -10.0, max = 10.0, default = 0.1)
     bpy.types.WindowManager.extractOffsetFloat = FloatProperty(min = -10.0, max = 10.0, default = 0.0)
@@ -205,6 +255,8 @@ def register():
                      default = "SOLID")
     
     bpy.types.WindowManager.expand_grease_settings = BoolProperty(default=False)
+    bpy.types.WindowManager.expand_profile = BoolProperty(default=False)
+    bpy.types.WindowManager.profileOperators = BoolProperty(default = False)
 
     bpy.types.WindowManager.bolsymm = EnumProperty(name="",
                      items = (("NEGATIVE_X","-X to +X",""),
@@ -218,6 +270,10 @@ def register():
 def unregister():
     bpy.utils.unregister_module(__name__)
     
+    if Freeze.governorReset in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(Freeze.governorReset)
+    Freeze.governorReset(None)
+    
     kc = bpy.context.window_manager.keyconfigs.addon
     if kc:
         km = kc.keymaps["3D View"]
@@ -232,6 +288,16 @@ def unregister():
         del bpy.types.WindowManager.extractDepthFloat
         del bpy.types.WindowManager.extractSmoothIterationsInt
         del bpy.types.WindowManager.bolsymm
+        del bpy.types.WindowManager.booleanBatch
+        del bpy.types.WindowManager.booleanLocal
+        del bpy.types.WindowManager.xmirrorModeEnum
+        del bpy.types.WindowManager.freezeFaceBudget
+        del bpy.types.WindowManager.freezeGovernorBudget
+        del bpy.types.WindowManager.remeshModeEnum
+        del bpy.types.WindowManager.remeshTargetFaces
+        del bpy.types.WindowManager.remeshDetailSize
+        del bpy.types.WindowManager.expand_profile
+        del bpy.types.WindowManager.profileOperators
         
     except:
         pass
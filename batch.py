@@ -0,0 +1,155 @@
+# Runs a chain of sculpt tool operations over many files in parallel background Blender processes.
+#   python batch.py job.json [--workers N] [--blender path/to/blender]
+# The job file:
+#   {"inputs": ["assets/*.blend", "scans/*.obj"],
+#    "output": "processed",
+#    "steps": [{"op": "remesh", "mode": "FACES", "faces": 300000},
+#              {"op": "symmetrize", "direction": "NEGATIVE_X"},
+#              {"op": "decimate", "faceBudget": 100000}],
+#    "objects": ["Body"],       optional, all mesh objects otherwise
+#    "timeout": 1800, "retries": 1, "workers": 0, "blender": "blender", "keepLogs": false}
+# Steps: remesh, symmetrize, freeze, decimate, apply_modifiers, union. They run the same operators as the panel,
+# see batchWorker.py for their parameters. The results are written to the output directory with the input's name,
+# next to batch.log and summary.json.
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+workerScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batchWorker.py")
+
+class Log:
+    def __init__(self, path):
+        self.file = open(path, 'a')
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        line = "%s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), message)
+        with self.lock:
+            print(line)
+            self.file.write(line + "\n")
+            self.file.flush()
+
+def expandInputs(patterns):
+    inputs = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            path = os.path.abspath(path)
+            if path not in inputs:
+                inputs.append(path)
+    return inputs
+
+# output paths keep the input's name, inputs with the same name from different directories get a number
+def outputPaths(inputs, outputDir):
+    paths = []
+    for path in inputs:
+        name, ext = os.path.splitext(os.path.basename(path))
+        output = os.path.join(outputDir, name + ext)
+        i = 1
+        while output in paths:
+            output = os.path.join(outputDir, "%s_%d%s" % (name, i, ext))
+            i += 1
+        paths.append(output)
+    return paths
+
+def runTask(job, task, jobDir, log):
+    command = [job["blender"], "-b"]
+    if task["input"].lower().endswith(".blend"):
+        command.append(task["input"])
+    command += ["--factory-startup", "--python", workerScript, "--", task["path"]]
+
+    for attempt in range(1, job["retries"]+2):
+        if os.path.exists(task["result"]):
+            os.remove(task["result"])
+        startTime = time.time()
+        error = None
+        try:
+            with open(os.path.join(jobDir, "%s.%d.log" % (task["name"], attempt)), 'w') as output:
+                subprocess.run(command, stdout=output, stderr=subprocess.STDOUT, timeout=job["timeout"])
+        except subprocess.TimeoutExpired:
+            error = "timed out after %ds" % job["timeout"]
+
+        result = None
+        if error is None:
+            try:
+                with open(task["result"]) as f:
+                    result = json.load(f)
+                error = result.get("error")
+            except (IOError, OSError, ValueError):
+                error = "worker exited without a result"
+
+        seconds = time.time()-startTime
+        if error is None:
+            log.write("done   %s (attempt %d, %.1fs)" % (task["input"], attempt, seconds))
+            result.update(status="done", attempts=attempt)
+            return result
+        log.write("failed %s (attempt %d, %.1fs): %s" % (task["input"], attempt, seconds, error.strip().splitlines()[-1]))
+
+    return {"input": task["input"], "status": "failed", "attempts": attempt, "error": error}
+
+def runJob(job):
+    outputDir = os.path.abspath(job["output"])
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    log = Log(os.path.join(outputDir, "batch.log"))
+    jobDir = tempfile.mkdtemp(prefix="sculpt_batch_")
+
+    inputs = expandInputs(job["inputs"])
+    tasks = []
+    for i, (path, output) in enumerate(zip(inputs, outputPaths(inputs, outputDir))):
+        task = {"input": path, "output": output, "steps": job["steps"], "objects": job.get("objects"),
+                "name": "task%04d" % i, "path": os.path.join(jobDir, "task%04d.json" % i),
+                "result": os.path.join(jobDir, "task%04d.result.json" % i)}
+        with open(task["path"], 'w') as f:
+            json.dump(task, f, indent=1)
+        tasks.append(task)
+
+    log.write("%d files, %d workers, steps: %s" % (len(tasks), job["workers"], ", ".join(step["op"] for step in job["steps"])))
+    startTime = time.time()
+    try:
+        with ThreadPoolExecutor(job["workers"]) as pool:
+            results = list(pool.map(lambda task: runTask(job, task, jobDir, log), tasks))
+    finally:
+        if job.get("keepLogs"):
+            log.write("worker logs kept in %s" % jobDir)
+        else:
+            shutil.rmtree(jobDir, ignore_errors=True)
+
+    failed = [result for result in results if result["status"] != "done"]
+    summary = {"files": len(results), "done": len(results)-len(failed), "failed": len(failed),
+               "seconds": time.time()-startTime, "results": results}
+    with open(os.path.join(outputDir, "summary.json"), 'w') as f:
+        json.dump(summary, f, indent=1)
+    log.write("%d done, %d failed in %.1fs" % (summary["done"], summary["failed"], summary["seconds"]))
+    for result in failed:
+        log.write("  failed: %s" % result["input"])
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(prog="batch.py")
+    parser.add_argument("job")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--blender")
+    args = parser.parse_args()
+
+    with open(args.job) as f:
+        job = json.load(f)
+    job.setdefault("timeout", 1800)
+    job.setdefault("retries", 1)
+    job.setdefault("blender", os.environ.get("BLENDER", "blender"))
+    job["workers"] = args.workers or job.get("workers") or os.cpu_count() or 1
+    if args.blender:
+        job["blender"] = args.blender
+
+    summary = runJob(job)
+    sys.exit(1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Headless batch worker, started by batch.py for every input file as
+#   blender -b [input.blend] --factory-startup --python batchWorker.py -- <task.json>
+# Runs the task's steps through the add-on's operators, saves the result and writes the result file of the task.
+import bpy
+import os
+import sys
+import json
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import headless
+
+def targets(names):
+    objects = [ob for ob in bpy.context.scene.objects if ob.type == 'MESH']
+    if names:
+        objects = [ob for ob in objects if ob.name in names]
+    return objects
+
+def select(objects, active):
+    for ob in bpy.context.scene.objects:
+        ob.select = ob in objects
+    bpy.context.scene.objects.active = active
+
+def faceCounts(objects):
+    return dict((ob.name, len(ob.data.polygons)) for ob in objects)
+
+# ---- steps, each runs the operator the panel button runs ----
+
+def stepRemesh(objects, step):
+    wm = bpy.context.window_manager
+    wm.remeshModeEnum = step.get("mode", "DEPTH")
+    wm.remeshDepthInt = step.get("depth", wm.remeshDepthInt)
+    wm.remeshTargetFaces = step.get("faces", wm.remeshTargetFaces)
+    wm.remeshDetailSize = step.get("detail", wm.remeshDetailSize)
+    wm.remeshSubdivisions = step.get("subdivisions", 0)
+    wm.remeshPreserveShape = step.get("preserveShape", True)
+    for ob in objects:
+        select([ob], ob)
+        bpy.ops.sculpt.remesh()
+
+def stepSymmetrize(objects, step):
+    bpy.context.window_manager.bolsymm = step.get("direction", "NEGATIVE_X")
+    for ob in objects:
+        select([ob], ob)
+        bpy.ops.boolean.grease_symm(symm_int = step.get("threshold", 0.001))
+
+def stepFreeze(objects, step):
+    bpy.context.window_manager.freezeFaceBudget = step.get("faceBudget", 100000)
+    select(objects, objects[0])
+    bpy.ops.boolean.freeze()
+
+# the Freeze level that fits the budget, kept for good
+def stepDecimate(objects, step):
+    Freeze = headless.loadAddon().Freeze
+    for ob in objects:
+        levels = Freeze.freezeLevels(ob)
+        source = ob.data
+        ob.data = levels[Freeze.levelForBudget(levels, step.get("faceBudget", 100000))]
+        Freeze.releaseLevels(source)
+        if source.users == 0:
+            bpy.data.meshes.remove(source)
+
+def stepApplyModifiers(objects, step):
+    select(objects, objects[0])
+    bpy.ops.boolean.mod_apply()
+
+# everything is merged into the largest object
+def stepUnion(objects, step):
+    if len(objects) > 1:
+        largest = max(objects, key=lambda ob: len(ob.data.polygons))
+        select(objects, largest)
+        bpy.ops.boolean.union()
+
+steps = {"remesh": stepRemesh,
+         "symmetrize": stepSymmetrize,
+         "freeze": stepFreeze,
+         "decimate": stepDecimate,
+         "apply_modifiers": stepApplyModifiers,
+         "union": stepUnion}
+
+def load(path):
+    if path.lower().endswith(".obj"):
+        for ob in list(bpy.context.scene.objects):
+            bpy.context.scene.objects.unlink(ob)
+            bpy.data.objects.remove(ob)
+        bpy.ops.import_scene.obj(filepath = path)
+
+def save(path):
+    if path.lower().endswith(".obj"):
+        bpy.ops.export_scene.obj(filepath = path)
+    else:
+        bpy.ops.wm.save_as_mainfile(filepath = path, check_existing = False)
+
+def run(task):
+    headless.loadAddon()
+    load(task["input"])
+    names = task.get("objects")
+    result = {"input": task["input"], "output": task["output"], "steps": [], "facesBefore": faceCounts(targets(names))}
+    startTime = time.time()
+    for step in task["steps"]:
+        objects = targets(names)
+        if not objects:
+            raise RuntimeError("No mesh objects to work on")
+        stepTime = time.time()
+        steps[step["op"]](objects, step)
+        result["steps"].append({"op": step["op"], "seconds": time.time()-stepTime})
+    save(task["output"])
+    result["facesAfter"] = faceCounts(targets(names))
+    result["seconds"] = time.time()-startTime
+    return result
+
+def main():
+    with open(headless.scriptArgs()[0]) as f:
+        task = json.load(f)
+    try:
+        result = run(task)
+    except Exception:
+        result = {"input": task["input"], "error": traceback.format_exc()}
+    # blender exits cleanly even when the script fails, so the result file is what batch.py goes by
+    with open(task["result"] + '.tmp', 'w') as f:
+        json.dump(result, f, indent=1)
+    os.replace(task["result"] + '.tmp', task["result"])
+
+main()
@@ -0,0 +1,353 @@
+# Benchmark suite of the add-on's operators over generated meshes.
+#   blender -b --factory-startup --python benchmark.py -- [--out results.json] [--baseline baseline.json]
+#       [--max-faces N] [--cases remesh,union,...] [--meshes sphere,torus,blob] [--repeat N] [--threshold 0.1]
+# Comparing two result files doesn't need Blender:
+#   python benchmark.py --compare results.json --baseline baseline.json
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+try:
+    import bpy
+    import bmesh
+    from mathutils import Matrix, Vector
+except ImportError:
+    bpy = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import headless
+
+# runs slower than this fraction above the baseline are flagged, unless they are within the noise floor in seconds
+slowdownThreshold = 0.10
+noiseFloor = 0.02
+
+# ---- test meshes, all deterministic ----
+
+def icoSphereArrays(subdivisions):
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions = subdivisions, size = 1.0)
+    ob = bpy.context.active_object
+    mesh = ob.data
+    co, loopTotal, loopVerts = headless.loadAddon().helper.meshToArrays(mesh)
+    bpy.context.scene.objects.unlink(ob)
+    bpy.data.objects.remove(ob)
+    bpy.data.meshes.remove(mesh)
+    return co, loopTotal, loopVerts
+
+def torusArrays(major, minor, majorRadius = 1.0, minorRadius = 0.35):
+    u = np.repeat(np.linspace(0.0, 2*np.pi, major, endpoint=False), minor)
+    v = np.tile(np.linspace(0.0, 2*np.pi, minor, endpoint=False), major)
+    ring = majorRadius + minorRadius*np.cos(v)
+    co = np.column_stack((ring*np.cos(u), ring*np.sin(u), minorRadius*np.sin(v)))
+
+    i = np.repeat(np.arange(major), minor)
+    j = np.tile(np.arange(minor), major)
+    nextI = (i+1) % major
+    nextJ = (j+1) % minor
+    loopVerts = np.column_stack((i*minor+j, nextI*minor+j, nextI*minor+nextJ, i*minor+nextJ)).ravel()
+    return co, np.full(major*minor, 4, dtype=np.int32), loopVerts.astype(np.int32)
+
+# an ico sphere pushed along its normals by a few seeded waves
+def blobArrays(subdivisions, seed = 1):
+    co, loopTotal, loopVerts = icoSphereArrays(subdivisions)
+    rng = np.random.RandomState(seed)
+    displace = np.zeros(len(co))
+    for i in range(6):
+        direction = rng.normal(size=3)
+        displace += 0.08 * np.sin(co.dot(direction)*rng.uniform(2.0, 6.0) + rng.uniform(0.0, 2*np.pi))
+    return co * (1.0 + displace)[:, None], loopTotal, loopVerts
+
+# name, builder, face count
+testMeshes = [("sphere", lambda n=n: icoSphereArrays(n), 20*4**n) for n in (5, 6, 7, 8)] + \
+             [("torus", lambda m=m: torusArrays(*m), m[0]*m[1]) for m in ((100, 100), (400, 250), (1000, 500), (2000, 1000))] + \
+             [("blob", lambda n=n: blobArrays(n), 20*4**n) for n in (5, 6, 7, 8)]
+
+# ---- scene handling ----
+
+def clearScene():
+    scene = bpy.context.scene
+    if bpy.context.active_object is not None and bpy.context.active_object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for ob in list(scene.objects):
+        scene.objects.unlink(ob)
+        bpy.data.objects.remove(ob)
+    for mesh in list(bpy.data.meshes):
+        mesh.use_fake_user = False
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+    for group in list(bpy.data.groups):
+        bpy.data.groups.remove(group)
+    headless.loadAddon().meshExtract.extractCache.clear()
+    bpy.context.window_manager.booleanLocal = False
+    bpy.context.window_manager.booleanBatch = False
+
+def addObject(name, arrays, location = (0.0, 0.0, 0.0), scale = 1.0):
+    mesh = bpy.data.meshes.new(name)
+    headless.loadAddon().helper.meshFromArrays(mesh, *arrays)
+    ob = bpy.data.objects.new(name, mesh)
+    ob.location = location
+    ob.scale = (scale, scale, scale)
+    bpy.context.scene.objects.link(ob)
+    bpy.context.scene.update()
+    return ob
+
+def select(objects, active):
+    for ob in bpy.context.scene.objects:
+        ob.select = ob in objects
+    bpy.context.scene.objects.active = active
+
+# a closed circle in the XY plane, seen through the identity view matrix (looking down the Z axis)
+def strokeCircle(radius = 0.5, count = 64):
+    angles = np.linspace(0.0, 2*np.pi, count, endpoint=False)
+    return np.column_stack((radius*np.cos(angles), radius*np.sin(angles), np.full(count, 2.0)))
+
+# ---- cases, each returns the function to time ----
+
+def caseRemesh(depth):
+    def setup(arrays):
+        ob = addObject("Bench", arrays)
+        select([ob], ob)
+        wm = bpy.context.window_manager
+        wm.remeshModeEnum = 'DEPTH'
+        wm.remeshDepthInt = depth
+        wm.remeshSubdivisions = 0
+        wm.remeshPreserveShape = False
+        return bpy.ops.sculpt.remesh
+    return setup
+
+def caseBoolean(operator, **options):
+    def setup(arrays):
+        target = addObject("Bench", arrays)
+        operand = addObject("Operand", arrays, location = (0.6, 0.3, 0.2), scale = 0.7)
+        select([target, operand], target)
+        return lambda: getattr(bpy.ops.boolean, operator)(**options)
+    return setup
+
+# the mesh with operands spread around it, folded in one at a time or as a balanced tree
+def caseManyBoolean(operator, batch, count = 6):
+    def setup(arrays):
+        target = addObject("Bench", arrays)
+        operands = []
+        for i in range(count):
+            angle = 2*np.pi*i/count
+            operands.append(addObject("Operand", arrays, location = (0.9*np.cos(angle), 0.9*np.sin(angle), 0.0), scale = 0.4))
+        select([target] + operands, target)
+        bpy.context.window_manager.booleanBatch = batch
+        return getattr(bpy.ops.boolean, operator)
+    return setup
+
+# a small cutter on the surface of the mesh, cut with and without the localized boolean
+def caseSmallBoolean(operator, local):
+    def setup(arrays):
+        target = addObject("Bench", arrays)
+        operand = addObject("Operand", arrays, location = (0.95, 0.0, 0.3), scale = 0.15)
+        select([target, operand], target)
+        bpy.context.window_manager.booleanLocal = local
+        return getattr(bpy.ops.boolean, operator)
+    return setup
+
+# a mirrored cutter away from the mesh, like an X-Mirror instance, must leave the mesh as it is
+def caseMirroredDifference(arrays):
+    target = addObject("Bench", arrays)
+    operand = addObject("Operand", arrays, location = (3.0, 0.0, 0.0), scale = 0.5)
+    operand.scale = (-0.5, 0.5, 0.5)
+    select([target, operand], target)
+    faces = len(target.data.polygons)
+    def run():
+        bpy.ops.boolean.difference()
+        if len(target.data.polygons) != faces:
+            raise RuntimeError("mirrored cutter changed the mesh: %d -> %d faces" % (faces, len(target.data.polygons)))
+    return run
+
+# a localized difference would rebuild the target from arrays, so one with vertex groups must take the modifier
+def caseWeightedDifference(arrays):
+    helper = headless.loadAddon().helper
+    target = addObject("Bench", arrays)
+    group = target.vertex_groups.new("Weights")
+    group.add(list(range(len(target.data.vertices))), 1.0, 'REPLACE')
+    operand = addObject("Operand", arrays, location = (0.95, 0.0, 0.3), scale = 0.15)
+    select([target, operand], target)
+    bpy.context.window_manager.booleanLocal = True
+    def run():
+        localized = helper.counters['boolean_localized']
+        bpy.ops.boolean.difference()
+        if helper.counters['boolean_localized'] != localized or len(target.vertex_groups) == 0:
+            raise RuntimeError("the localized difference dropped the vertex groups")
+    return run
+
+def caseGreaseCut(method):
+    def setup(arrays):
+        addon = headless.loadAddon()
+        ob = addObject("Bench", arrays)
+        select([ob], ob)
+        stroke = strokeCircle()
+        if method == 'PARTITION':
+            # the operator needs a 3D view for the view matrix, so the partition engine is timed directly
+            def run():
+                pieces = addon.strokeCut.strokePartition(ob, [stroke], Matrix.Identity(4))
+                addon.greaseTrim.writePieces(bpy.context, ob, pieces, True)
+            return run
+
+        # the ruler is the stroke as a closed edge loop, like a converted grease pencil stroke
+        rulerMesh = bpy.data.meshes.new("Ruler")
+        rulerMesh.from_pydata(stroke.tolist(), [(i, (i+1) % len(stroke)) for i in range(len(stroke))], [])
+        ruler = bpy.data.objects.new("Ruler", rulerMesh)
+        bpy.context.scene.objects.link(ruler)
+        def run():
+            addon.greaseTrim.cutterPrism(ruler, ob, Vector((0.0, 0.0, 1.0)), 32)
+            select([ob, ruler], ob)
+            bpy.ops.boolean.separate()
+        return run
+    return setup
+
+def caseMaskExtract(arrays):
+    ob = addObject("Bench", arrays)
+    bm = bmesh.new()
+    bm.from_mesh(ob.data)
+    mask = bm.verts.layers.paint_mask.verify()
+    for v in bm.verts:
+        v[mask] = 1.0 if v.co.z > 0.3 else 0.0
+    bm.to_mesh(ob.data)
+    bm.free()
+    select([ob], ob)
+    bpy.ops.object.mode_set(mode='SCULPT')
+    bpy.context.window_manager.extractStyleEnum = 'SOLID'
+    return bpy.ops.boolean.mask_extract
+
+def caseFreeze(arrays):
+    ob = addObject("Bench", arrays)
+    select([ob], ob)
+    return bpy.ops.boolean.freeze
+
+def caseUnfreeze(arrays):
+    ob = addObject("Bench", arrays)
+    select([ob], ob)
+    bpy.ops.boolean.freeze()
+    return bpy.ops.boolean.unfreeze
+
+def caseSymmetrize(arrays):
+    ob = addObject("Bench", arrays, location = (0.2, 0.0, 0.0))
+    select([ob], ob)
+    bpy.context.window_manager.bolsymm = 'NEGATIVE_X'
+    return bpy.ops.boolean.grease_symm
+
+testCases = [("remesh depth %d" % depth, caseRemesh(depth)) for depth in (4, 6, 8)] + \
+            [(operator, caseBoolean(operator)) for operator in ("union", "difference", "intersect", "separate")] + \
+            [("modifier separate", caseBoolean("separate", method='MODIFIER')),
+             ("mirrored difference", caseMirroredDifference),
+             ("many union sequential", caseManyBoolean("union", False)),
+             ("many union balanced", caseManyBoolean("union", True)),
+             ("many difference sequential", caseManyBoolean("difference", False)),
+             ("many difference balanced", caseManyBoolean("difference", True)),
+             ("small difference", caseSmallBoolean("difference", False)),
+             ("small difference localized", caseSmallBoolean("difference", True)),
+             ("small clone", caseSmallBoolean("clone", False)),
+             ("small clone localized", caseSmallBoolean("clone", True)),
+             ("weighted difference localized", caseWeightedDifference),
+             ("grease cut partition", caseGreaseCut('PARTITION')),
+             ("grease cut boolean", caseGreaseCut('BOOLEAN')),
+             ("mask extract", caseMaskExtract),
+             ("freeze", caseFreeze),
+             ("unfreeze", caseUnfreeze),
+             ("symmetrize", caseSymmetrize)]
+
+# ---- running and comparing ----
+
+# Peak memory is that of the whole process and never goes down, so a case only shows its own peak when it
+# is the first one to reach it. To compare two variants run them in separate processes, e.g. --cases separate
+# and --cases "modifier separate".
+def runCase(setup, arrays, repeat):
+    timings = []
+    for i in range(repeat):
+        clearScene()
+        run = setup(arrays)
+        startTime = time.perf_counter()
+        run()
+        timings.append(time.perf_counter()-startTime)
+    clearScene()
+    return timings
+
+def runSuite(args):
+    profiling = headless.loadAddon().profiling
+    results = {}
+    for meshName, build, faces in testMeshes:
+        if faces > args.max_faces or (args.meshes and meshName not in args.meshes):
+            continue
+        arrays = build()
+        for caseName, setup in testCases:
+            if args.cases and not any(caseName.startswith(case) for case in args.cases):
+                continue
+            key = "%s / %s %d" % (caseName, meshName, faces)
+            try:
+                memory = profiling.peakMemory()
+                timings = runCase(setup, arrays, args.repeat)
+                peak = profiling.peakMemory()
+                results[key] = {"seconds": min(timings), "median": float(np.median(timings)), "faces": faces,
+                                "processPeakMemory": peak, "memoryGrowth": peak-memory if peak is not None else None}
+                print("%-40s %8.3fs %8s" % (key, min(timings), "%.0fMB" % peak if peak is not None else ""))
+            except Exception as e:
+                clearScene()
+                results[key] = {"error": str(e), "faces": faces}
+                print("%-40s failed: %s" % (key, e))
+    return {"blender": bpy.app.version_string, "platform": platform.platform(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "repeat": args.repeat, "results": results}
+
+# cases that got slower than the baseline, as (key, baseline seconds, seconds)
+def compare(current, baseline, threshold = slowdownThreshold):
+    slowdowns = []
+    for key, result in sorted(current["results"].items()):
+        base = baseline["results"].get(key)
+        if base is None or "seconds" not in base or "seconds" not in result:
+            continue
+        if result["seconds"] > base["seconds"]*(1.0+threshold) and result["seconds"]-base["seconds"] > noiseFloor:
+            slowdowns.append((key, base["seconds"], result["seconds"]))
+    return slowdowns
+
+def report(current, baseline, threshold):
+    for key, result in sorted(current["results"].items()):
+        base = baseline["results"].get(key, {})
+        if "seconds" in result and "seconds" in base:
+            print("%-40s %8.3fs -> %8.3fs (%+.0f%%)" % (key, base["seconds"], result["seconds"], 100.0*(result["seconds"]/max(base["seconds"], 1e-9)-1.0)))
+            if base.get("memoryGrowth") is not None and result.get("memoryGrowth") is not None:
+                print("%-40s %7.0fMB -> %7.0fMB peak growth" % ("", base["memoryGrowth"], result["memoryGrowth"]))
+    slowdowns = compare(current, baseline, threshold)
+    for key, before, after in slowdowns:
+        print("SLOWER: %s %.3fs -> %.3fs" % (key, before, after))
+    return slowdowns
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(prog="benchmark.py")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--compare", help="result file to compare against the baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=slowdownThreshold)
+    parser.add_argument("--max-faces", type=int, default=2100000)
+    parser.add_argument("--meshes", type=lambda s: s.split(","), default=[])
+    parser.add_argument("--cases", type=lambda s: s.split(","), default=[])
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+def main():
+    args = parseArgs(headless.scriptArgs() if bpy is not None else sys.argv[1:])
+    if args.compare:
+        with open(args.compare) as f:
+            current = json.load(f)
+    elif bpy is None:
+        sys.exit("Run the benchmark inside Blender: blender -b --factory-startup --python benchmark.py -- ...")
+    else:
+        current = runSuite(args)
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=1, sort_keys=True)
+        print("Wrote", args.out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if report(current, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,556 @@
 import bpy
-from . import helper
+import time
+import bmesh
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+from . import helper, profiling
+
+# world space bounding box of the object as (min, max)
+def objBounds(obj):
+    corners = np.array([obj.matrix_world * Vector(corner) for corner in obj.bound_box])
+    return corners.min(axis=0), corners.max(axis=0)
+
+def objWorldBVH(obj):
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    bm.transform(obj.matrix_world)
+    if obj.matrix_world.determinant() < 0.0:
+        # the tree takes its normals from the winding, a mirrored object would come out inside out
+        bmesh.ops.reverse_faces(bm, faces=bm.faces[:])
+    tree = BVHTree.FromBMesh(bm)
+    bm.free()
+    return tree
+
+# world space tree of only the object's faces whose bounding box reaches into the world space box of low and high,
+# None when there are none
+def objCropBVH(obj, low, high):
+    co, loopTotal, loopVerts = helper.meshToArrays(obj.data)
+    matrix = np.array(obj.matrix_world)
+    co = co.dot(matrix[:3, :3].T) + matrix[:3, 3]
+    faceMask = localFaces(co, loopTotal, loopVerts, low, high)
+    if not faceMask.any():
+        return None
+    co, loopTotal, loopVerts, used = helper.meshSubset(co, loopTotal, loopVerts, faceMask)
+    if obj.matrix_world.determinant() < 0.0:
+        loopVerts = loopVerts[loopReverseOrder(loopTotal)]
+    polygons = [face.tolist() for face in np.split(loopVerts, np.cumsum(loopTotal)[:-1])]
+    return BVHTree.FromPolygons(co.tolist(), polygons)
+
+# the target's faces further than this share of the operand's size from the operand's box are left out of the tree
+cropShare = 0.25
+
+# whether the world space point is inside the closed mesh of the tree
+def pointInside(tree, point):
+    location, normal, index, distance = tree.find_nearest(point)
+    return location is not None and (location - point).dot(normal) > 0.0
+
+def meshClear(mesh):
+    bm = bmesh.new()
+    bm.to_mesh(mesh)
+    bm.free()
+
+# adds the operand's geometry to the target's mesh, like a join
+def meshAppend(target, operand):
+    mesh = operand.data.copy()
+    matrix = target.matrix_world.inverted() * operand.matrix_world
+    mesh.transform(matrix)
+    if matrix.determinant() < 0.0:
+        # a mirrored operand would come in inside out
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bmesh.ops.reverse_faces(bm, faces=bm.faces[:])
+        bm.to_mesh(mesh)
+        bm.free()
+    
+    # the operand's materials go into the target's slots, missing ones are added
+    materials = list(target.data.materials)
+    remap = []
+    for mat in operand.data.materials:
+        if mat not in materials:
+            target.data.materials.append(mat)
+            materials.append(mat)
+        remap.append(materials.index(mat))
+    if remap:
+        indices = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('material_index', indices)
+        mesh.polygons.foreach_set('material_index', np.array(remap, dtype=np.int32)[np.minimum(indices, len(remap)-1)])
+    
+    # from_mesh adds to what is already in the BMesh
+    bm = bmesh.new()
+    bm.from_mesh(target.data)
+    bm.from_mesh(mesh)
+    bm.to_mesh(target.data)
+    bm.free()
+    bpy.data.meshes.remove(mesh)
+
+# Does the boolean without the solver when the surfaces of the two meshes don't cross, then one of them is
+# either outside or inside the other. Returns False when the solver is needed. The operand is left alone
+def booleanShortcut(target, operand, operation):
+    # the solver sees the evaluated meshes, and edit or sculpt mode owns the target's mesh
+    if len(target.modifiers) > 0 or len(operand.modifiers) > 0 or target.mode != 'OBJECT':
+        return False
+    # clearing or appending to the mesh would leave its shape keys behind
+    if target.data.shape_keys is not None or operand.data.shape_keys is not None:
+        return False
+    if len(target.data.vertices) == 0 or len(operand.data.vertices) == 0:
+        return False
+    
+    targetMin, targetMax = objBounds(target)
+    operandMin, operandMax = objBounds(operand)
+    contained = None
+    if (targetMin <= operandMax).all() and (operandMin <= targetMax).all():
+        # only the target's faces around the operand can cross it
+        margin = cropShare * float(np.linalg.norm(operandMax - operandMin)) + 1e-6
+        low, high = operandMin - margin, operandMax + margin
+        cropTree = objCropBVH(target, low, high)
+        operandTree = objWorldBVH(operand)
+        if cropTree is not None and cropTree.overlap(operandTree):
+            return False
+        # which one is inside the other can only be told for closed meshes, open cutters go to the solver
+        if not helper.meshClosed(target.data) or not helper.meshClosed(operand.data):
+            return False
+        
+        # the nearest face in the crop is the nearest of the whole target when it is closer than the crop's
+        # boundary, otherwise the tree of the whole target is needed after all
+        point = operand.matrix_world * operand.data.vertices[0].co
+        targetTree = cropTree
+        if cropTree is not None:
+            location = cropTree.find_nearest(point)[0]
+            if location is None or (location - point).length > min((np.array(point) - low).min(), (high - np.array(point)).min()):
+                targetTree = None
+        if targetTree is None:
+            targetTree = objWorldBVH(target)
+        
+        if pointInside(targetTree, point):
+            contained = 'OPERAND'
+        elif pointInside(operandTree, target.matrix_world * target.data.vertices[0].co):
+            contained = 'TARGET'
+    
+    if contained is None:
+        # apart from each other
+        if operation == 'UNION':
+            meshAppend(target, operand)
+        elif operation == 'INTERSECT':
+            meshClear(target.data)
+        return True
+    if contained == 'OPERAND':
+        if operation == 'DIFFERENCE':
+            return False
+        if operation == 'INTERSECT':
+            meshClear(target.data)
+            meshAppend(target, operand)
+        return True
+    # the target is inside the operand
+    if operation == 'UNION':
+        meshClear(target.data)
+        meshAppend(target, operand)
+    elif operation == 'DIFFERENCE':
+        meshClear(target.data)
+    return True
+
+# helper function to apply a single boolean modifier and remove the operand
+def booleanApply(target, operand, operation):
+    
+    #deselect all the faces of the target object
+    helper.meshSelectFaces(target.data, 'DESELECT')
+
+    #select all the faces of the operand
+    helper.meshSelectFaces(operand.data, 'SELECT')
+    
+    with profiling.stage("prefilter"):
+        shortcut = booleanShortcut(target, operand, operation)
+    if shortcut:
+        helper.counters['boolean_skipped'] += 1
+    elif operation == 'DIFFERENCE' and bpy.context.window_manager.booleanLocal and booleanLocal(bpy.context, target, operand, operation):
+        helper.counters['boolean_localized'] += 1
+    else:
+        helper.setActive(target)
+
+        modName = 'boolean'+operation.lower()
+        md = target.modifiers.new(modName, 'BOOLEAN')
+        md.operation = operation
+        md.object = operand
+        # apply the modifier
+        with profiling.stage("boolean"):
+            helper.modifierApply(modName)
+    bpy.data.scenes[0].objects.unlink(operand)
+    bpy.data.objects.remove(operand)
+
+def objFaceCount(obj):
+    return len(obj.data.polygons)
+
+def objCenter(obj):
+    return obj.matrix_world * (sum((Vector(corner) for corner in obj.bound_box), Vector()) / 8.0)
+
+# merges the operands pairwise, level by level, so that no single mesh grows much faster than the rest.
+# Each level pairs the smallest remaining operand with its nearest neighbour.
+# Returns the surviving object and the number of faces that went through the solver.
+def booleanTree(operands, operation):
+    level = sorted(operands, key=objFaceCount)
+    processed = 0
+    while len(level) > 1:
+        nextLevel = []
+        while len(level) > 1:
+            obj = level.pop(0)
+            center = objCenter(obj)
+            partner = min(level, key=lambda o: (objCenter(o)-center).length)
+            level.remove(partner)
+            processed += objFaceCount(obj) + objFaceCount(partner)
+            booleanApply(obj, partner, operation)
+            nextLevel.append(obj)
+        nextLevel.extend(level)
+        level = sorted(nextLevel, key=objFaceCount)
+    return level[0], processed
+
+# estimated number of faces the solver has to process when folding operands into the target one at a time
+def sequentialCost(target, operands, operation):
+    running = objFaceCount(target)
+    processed = 0
+    for obj in operands:
+        processed += running + objFaceCount(obj)
+        if operation != 'INTERSECT':
+            running += objFaceCount(obj)
+    return processed
+
+def reportSkipped(op, skipped, calls):
+    if skipped > 0:
+        op.report({'INFO'}, "%d of %d solver calls skipped, the meshes didn't touch" % (skipped, calls))
+
+# shared body of the Union, Difference and Intersect operators
+def booleanMulti(op, context, operation):
+    # the operands become active on the way, the active object and its mode are put back at the end
+    with helper.ModeState():
+        activeObj = context.active_object
+        operands = [obj for obj in bpy.context.selected_objects if obj != activeObj]
+        skipped = helper.counters['boolean_skipped']
+    
+        if not context.window_manager.booleanBatch or len(operands) < 3:
+            for SelectedObject in operands :
+                booleanApply(activeObj, SelectedObject, operation)
+            reportSkipped(op, helper.counters['boolean_skipped']-skipped, len(operands))
+            return
+    
+        startTime = time.time()
+        seqCost = sequentialCost(activeObj, operands, operation)
+    
+        # a difference with many cutters is a difference with the union of the cutters
+        mergeOperation = 'INTERSECT' if operation == 'INTERSECT' else 'UNION'
+        merged, treeCost = booleanTree(operands, mergeOperation)
+    
+        treeCost += objFaceCount(activeObj) + objFaceCount(merged)
+        booleanApply(activeObj, merged, operation)
+    
+        # only a face count ratio, the benchmark's "many" cases time both ways
+        elapsed = time.time() - startTime
+        ratio = seqCost / max(treeCost, 1)
+        op.report({'INFO'}, "Balanced %s of %d objects: %.2fs, %.1fx fewer faces through the solver than sequential, %d solver calls skipped" % 
+            (operation.lower(), len(operands), elapsed, ratio, helper.counters['boolean_skipped']-skipped))
+
+# ---- single pass separate ----
+
+# the old way, intersect and difference modifiers on copies of both objects
+def separateModifiers(activeObj, SelectedObject):
+    #make a copy of the selected object
+    SelectedObjCopy = helper.objDuplicate(SelectedObject)
+    
+    #make a copy of the active object
+    activeObjCopy = helper.objDuplicate(activeObj)
+
+    helper.meshSelectFaces(activeObjCopy.data, 'SELECT')
+    helper.meshSelectFaces(SelectedObject.data, 'DESELECT')
+    
+    md = SelectedObject.modifiers.new('sepIntersect', 'BOOLEAN')
+    md.operation = 'INTERSECT'
+    md.object = activeObjCopy
+    # apply the modifier 
+    helper.setActive(SelectedObject)
+    helper.modifierApply("sepIntersect")
+    
+    helper.meshSelectFaces(SelectedObject.data, 'INVERT')
+    
+    #delete the copy of the active object
+    helper.objDelete(activeObjCopy)
+    
+    helper.meshSelectFaces(SelectedObjCopy.data, 'SELECT')
+    helper.meshSelectFaces(activeObj.data, 'DESELECT')
+
+    md2 = activeObj.modifiers.new('sepDifference', 'BOOLEAN')
+    md2.operation = 'DIFFERENCE'
+    md2.object = SelectedObjCopy
+    
+    #apply the second modifier
+    helper.setActive(activeObj)
+    helper.modifierApply("sepDifference")
+    
+    #delete the copy of the selected object
+    helper.objDelete(SelectedObjCopy)
+
+# The single pass needs the intersect tool and cuts the meshes as they are stored, so modifiers would be
+# left out. The pieces are rebuilt from arrays, so shape keys and vertex groups would be lost
+def separateSinglePossible(activeObj, cutter):
+    if bpy.app.version < (2, 76, 0) or activeObj.data == cutter.data:
+        return False
+    for obj in (activeObj, cutter):
+        if len(obj.modifiers) > 0 or obj.data.shape_keys is not None or len(obj.vertex_groups) > 0:
+            return False
+    return True
+
+# the tree of the object's mesh in the local space of another object
+def objLocalBVH(obj, space):
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    matrix = space.matrix_world.inverted() * obj.matrix_world
+    bm.transform(matrix)
+    if matrix.determinant() < 0.0:
+        bmesh.ops.reverse_faces(bm, faces=bm.faces[:])
+    tree = BVHTree.FromBMesh(bm)
+    bm.free()
+    return tree
+
+# loop order that turns every face around, the first corner stays in place
+def loopReverseOrder(loopTotal):
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    start = np.repeat(loopStart, loopTotal)
+    total = np.repeat(loopTotal, loopTotal)
+    return start + (total - (np.arange(len(start)) - start)) % total
+
+# the faces picked by faceMask as a mesh of their own, the open edges left by the cut are welded shut
+def separatePart(co, loopTotal, loopVerts, loopData, faceData, faceMask, distance):
+    loopMask = np.repeat(faceMask, loopTotal)
+    loopData = [data[loopMask] for data in loopData]
+    faceData = [data[faceMask] for data in faceData]
+    co, loopTotal, loopVerts, used = helper.meshSubset(co, loopTotal, loopVerts, faceMask)
+    
+    boundary = np.flatnonzero(helper.boundaryVerts(len(co), loopTotal, loopVerts))
+    loopVerts = helper.weldVerts(co, boundary, distance)[loopVerts]
+    co, loopTotal, loopVerts, loopMask, faceMask = helper.meshCollapse(co, loopTotal, loopVerts)
+    return co, loopTotal, loopVerts, [data[loopMask] for data in loopData], [data[faceMask] for data in faceData]
+
+def meshFaceArrays(mesh):
+    smooth = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('use_smooth', smooth)
+    materials = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', materials)
+    return [smooth, materials]
+
+def partWrite(mesh, part, layers, materials):
+    co, loopTotal, loopVerts, loopData, (smooth, faceMaterials) = part
+    helper.meshFromArrays(mesh, co, loopTotal, loopVerts)
+    # the material indices are those of the cut mesh
+    for i, mat in enumerate(materials):
+        if i < len(mesh.materials):
+            mesh.materials[i] = mat
+        else:
+            mesh.materials.append(mat)
+    mesh.polygons.foreach_set('use_smooth', smooth)
+    mesh.polygons.foreach_set('material_index', faceMaterials)
+    helper.meshSetLoopLayers(mesh, [(kind, name, data) for (kind, name, old), data in zip(layers, loopData)])
+
+# writes a part made in the space of obj into the mesh of target
+def partWriteTo(target, obj, part, layers, materials):
+    co, loopTotal, loopVerts, loopData, faceData = part
+    matrix = target.matrix_world.inverted() * obj.matrix_world
+    transform = np.array(matrix, dtype=np.float64)
+    co = co.dot(transform[:3, :3].T) + transform[:3, 3]
+    if matrix.determinant() < 0.0:
+        order = loopReverseOrder(loopTotal)
+        loopVerts = loopVerts[order]
+        loopData = [data[order] for data in loopData]
+    if target.data.users > 1:
+        target.data = target.data.copy()
+    partWrite(target.data, (co, loopTotal, loopVerts, loopData, faceData), layers, materials)
+
+# The faces of the target's part outside the cutter with the cutter's faces inside the target turned around,
+# so they close the hole from the other side
+def cutOutside(cut):
+    (co, loopTotal, loopVerts, loopData, faceData), fromCutter, inside = cut
+    order = np.where(np.repeat(fromCutter, loopTotal), loopReverseOrder(loopTotal), np.arange(len(loopVerts)))
+    return (co, loopTotal, loopVerts[order], [data[order] for data in loopData], faceData), fromCutter == inside
+
+def weldDistance(co):
+    return 1e-6 * max(float(np.linalg.norm(co.max(axis=0) - co.min(axis=0))), 1e-6) if len(co) else 0.0
+
+# Cuts a part of the target, given as arrays in its space, against the cutter in one go. Both go into one temporary
+# object that the intersect tool cuts once, each piece is then sorted by whether it is inside the other mesh.
+# When the part is only a crop of the target, margin is how far around the cutter the crop reaches. A piece of the
+# cutter further than that from the part may be closer to the rest of the target, then the cut gives up.
+# Returns the cut arrays, which faces came from the cutter, which are inside the other mesh and the materials,
+# or None when it gave up
+def cutPieces(context, target, cutter, part, layers, margin = None):
+    mesh = bpy.data.meshes.new("BooleanCut")
+    partWrite(mesh, part, layers, target.data.materials)
+    partTree = helper.meshBVH(mesh)
+    temp = bpy.data.objects.new("BooleanCut", mesh)
+    temp.matrix_world = target.matrix_world
+    context.scene.objects.link(temp)
+    partFaces = len(mesh.polygons)
+    
+    # the cutter's faces end up selected, the intersect tool cuts them against the unselected ones
+    helper.meshSelectFaces(mesh, 'SELECT')
+    helper.meshSelectFaces(cutter.data, 'DESELECT')
+    meshAppend(temp, cutter)
+    helper.meshSelectFaces(mesh, 'INVERT')
+    fromCutter = np.arange(len(mesh.polygons)) >= partFaces
+    mesh.polygon_layers_int.new(name="cutSource")
+    mesh.polygon_layers_int["cutSource"].data.foreach_set('value', fromCutter.astype(np.int32))
+    
+    with profiling.stage("intersect"):
+        helper.setActive(temp)
+        helper.modeSet('EDIT')
+        helper.modeFlush()
+        if bpy.app.version >= (2, 78, 0):
+            bpy.ops.mesh.intersect(mode='SELECT_UNSELECT', separate_mode='ALL')
+        else:
+            bpy.ops.mesh.intersect(mode='SELECT_UNSELECT', use_separate=True)
+        helper.modeSet('OBJECT')
+        helper.modeFlush()
+    
+    with profiling.stage("sort"):
+        co, loopTotal, loopVerts = helper.meshToArrays(mesh)
+        faceCount = len(loopTotal)
+        source = np.empty(faceCount, dtype=np.int32)
+        mesh.polygon_layers_int["cutSource"].data.foreach_get('value', source)
+        fromCutter = source == 1
+        area = np.empty(faceCount, dtype=np.float32)
+        mesh.polygons.foreach_get('area', area)
+        center = np.empty(faceCount*3, dtype=np.float32)
+        mesh.polygons.foreach_get('center', center)
+        center = center.reshape(-1, 3)
+        # layers only the cutter has are left out
+        names = [(kind, name) for kind, name, data in layers]
+        loopData = [data for kind, name, data in helper.meshLoopLayers(mesh) if (kind, name) in names]
+        cut = (co, loopTotal, loopVerts, loopData, meshFaceArrays(mesh))
+        materials = list(mesh.materials)
+        
+        # the cut leaves every piece unconnected, the largest face of a piece decides which side it is on
+        loopStart = np.zeros(faceCount, dtype=np.int32)
+        np.cumsum(loopTotal[:-1], out=loopStart[1:])
+        faceIsland = helper.vertIslands(len(co), loopTotal, loopVerts)[loopVerts[loopStart]]
+        order = np.lexsort((-area, faceIsland))
+        first = order[np.r_[True, faceIsland[order][1:] != faceIsland[order][:-1]]] if faceCount else order
+        cutterTree = objLocalBVH(cutter, target)
+        islandInside = np.zeros(len(co), dtype=bool)
+        for face in first:
+            point = Vector(center[face])
+            tree = cutterTree
+            if fromCutter[face]:
+                tree = partTree
+                location, normal, index, distance = partTree.find_nearest(point)
+                if margin is not None and (location is None or distance > margin):
+                    helper.objDelete(temp)
+                    return None, None
+            islandInside[faceIsland[face]] = pointInside(tree, point)
+        inside = islandInside[faceIsland]
+    
+    helper.objDelete(temp)
+    return (cut, fromCutter, inside), materials
+
+# Separates the active object along the cutter in one cut. The part of the active object inside the cutter,
+# capped by the cutter, replaces the cutter's mesh, the rest stays in the active object.
+def separateSingle(context, activeObj, cutter):
+    with helper.ModeState():
+        helper.modeSet('OBJECT')
+        helper.modeFlush()
+        
+        co, loopTotal, loopVerts = helper.meshToArrays(activeObj.data)
+        layers = helper.meshLoopLayers(activeObj.data)
+        part = (co, loopTotal, loopVerts, [data for kind, name, data in layers], meshFaceArrays(activeObj.data))
+        cut, materials = cutPieces(context, activeObj, cutter, part, layers)
+        
+        with profiling.stage("write"):
+            (co, loopTotal, loopVerts, loopData, faceData), fromCutter, inside = cut
+            distance = weldDistance(co)
+            piece = separatePart(co, loopTotal, loopVerts, loopData, faceData, inside, distance)
+            outside, outsideMask = cutOutside(cut)
+            rest = separatePart(*outside, faceMask=outsideMask, distance=distance)
+            
+            partWriteTo(cutter, activeObj, piece, layers, materials)
+            partWrite(activeObj.data, rest, layers, materials)
+
+# ---- localized boolean ----
+
+# a cutter covering more than this share of the target's faces is cut against the whole target
+localShare = 0.5
+
+# faces of the target whose bounding box reaches into the box of low and high, in the target's space
+def localFaces(co, loopTotal, loopVerts, low, high):
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    loopCo = co[loopVerts]
+    faceLow = np.minimum.reduceat(loopCo, loopStart)
+    faceHigh = np.maximum.reduceat(loopCo, loopStart)
+    return ((faceHigh >= low) & (faceLow <= high)).all(axis=1)
+
+# the crop is rebuilt from arrays like the single pass separate, so the same objects, those with modifiers,
+# shape keys or vertex groups, take the modifier instead
+def localPossible(target, cutter):
+    if not separateSinglePossible(target, cutter):
+        return False
+    return target.mode == 'OBJECT' and len(target.data.polygons) > 0
+
+# Boolean of the target with a small cutter that only cuts the faces around the cutter. The crop reaches a
+# quarter of the cutter's size past its bounding box, so the crop boundary stays clear of the cut and is welded
+# back onto the untouched rest. 'DIFFERENCE' changes the target, 'INTERSECT' puts the part of the target inside
+# the cutter into the cutter's mesh, like Clone. Returns False when the crop would save nothing.
+def booleanLocal(context, target, cutter, operation):
+    if not localPossible(target, cutter):
+        return False
+    
+    with profiling.stage("crop"):
+        co, loopTotal, loopVerts = helper.meshToArrays(target.data)
+        matrix = target.matrix_world.inverted() * cutter.matrix_world
+        corners = np.array([matrix * Vector(corner) for corner in cutter.bound_box])
+        low = corners.min(axis=0)
+        high = corners.max(axis=0)
+        margin = 0.25 * float(np.linalg.norm(high - low)) + 1e-6
+        faceMask = localFaces(co, loopTotal, loopVerts, low - margin, high + margin)
+        if not faceMask.any() or faceMask.sum() > localShare * len(loopTotal):
+            return False
+        
+        layers = helper.meshLoopLayers(target.data)
+        loopData = [data for kind, name, data in layers]
+        faceData = meshFaceArrays(target.data)
+        loopMask = np.repeat(faceMask, loopTotal)
+        patchCo, patchTotal, patchVerts, used = helper.meshSubset(co, loopTotal, loopVerts, faceMask)
+        patch = (patchCo, patchTotal, patchVerts, [data[loopMask] for data in loopData], [data[faceMask] for data in faceData])
+    
+    with helper.ModeState():
+        cut, materials = cutPieces(context, target, cutter, patch, layers, margin)
+        if cut is None:
+            # the solver takes over, with the cutter's faces selected again as it expects
+            helper.meshSelectFaces(cutter.data, 'SELECT')
+            return False
+        distance = weldDistance(patchCo)
+        
+        with profiling.stage("stitch"):
+            if operation == 'INTERSECT':
+                piece = separatePart(*cut[0], faceMask=cut[2], distance=distance)
+                partWriteTo(cutter, target, piece, layers, materials)
+                return True
+            
+            outside, outsideMask = cutOutside(cut)
+            cutCo, cutTotal, cutVerts, cutLoopData, cutFaceData = separatePart(*outside, faceMask=outsideMask, distance=distance)
+            
+            # the vertices the patch shared with the rest, the crop boundary
+            inPatch = np.zeros(len(co), dtype=bool)
+            inPatch[loopVerts[loopMask]] = True
+            inRest = np.zeros(len(co), dtype=bool)
+            inRest[loopVerts[~loopMask]] = True
+            seam = np.flatnonzero(inPatch & inRest) + len(cutCo)
+            
+            result = (np.concatenate((cutCo, co)),
+                      np.concatenate((cutTotal, loopTotal[~faceMask])),
+                      np.concatenate((cutVerts, loopVerts[~loopMask] + len(cutCo))),
+                      [np.concatenate((new, old[~loopMask])) for new, old in zip(cutLoopData, loopData)],
+                      [np.concatenate((new, old[~faceMask])) for new, old in zip(cutFaceData, faceData)])
+            boundary = np.flatnonzero(helper.boundaryVerts(len(cutCo), cutTotal, cutVerts))
+            weld = helper.weldVerts(result[0], np.concatenate((seam, boundary)), distance)
+            co, loopTotal, loopVerts, loopMask, faceMask = helper.meshCollapse(result[0], result[1], weld[result[2]])
+            partWrite(target.data, (co, loopTotal, loopVerts, [data[loopMask] for data in result[3]],
+                                    [data[faceMask] for data in result[4]]), layers, materials)
+    return True
 
 class BooleanUnionOperator(bpy.types.Operator):
     '''Creates an union of the selected objects'''
@@ -13,23 +564,7 @@ class BooleanUnionOperator(bpy.types.Operator):
 
     def execute(self, context):
         # add a union boolean modifier
-        activeObj = context.active_object
-        for SelectedObject in bpy.context.selected_objects :
-            if SelectedObject != activeObj :
-
-                helper.objSelectFaces(activeObj, 'DESELECT')
-                helper.objSelectFaces(SelectedObject, 'SELECT')
-
-                bpy.context.scene.objects.active = activeObj
-
-                md = activeObj.modifiers.new('booleanunion', 'BOOLEAN')
-                md.operation = 'UNION'
-                md.object = SelectedObject       
-                # apply the modifier
-                bpy.ops.object.modifier_apply(apply_as='DATA', modifier="booleanunion")
-                bpy.data.scenes[0].objects.unlink(SelectedObject)
-                bpy.data.objects.remove(SelectedObject)
-        
+        booleanMulti(self, context, 'UNION')
         return {'FINISHED'}
 
 class BooleanDifferenceOperator(bpy.types.Operator):
@@ -44,26 +579,7 @@ class BooleanDifferenceOperator(bpy.types.Operator):
 
     def execute(self, context):
         # add a difference boolean modifier
-        activeObj = context.active_object
-        for SelectedObject in bpy.context.selected_objects :
-            if SelectedObject != activeObj :
-
-                #deselect all the faces of the active object
-                helper.objSelectFaces(activeObj, 'DESELECT')
-
-                #select all the faces of the selected object
-                helper.objSelectFaces(SelectedObject, 'SELECT')
-                
-                bpy.context.scene.objects.active = activeObj
-                
-                md = activeObj.modifiers.new('booleandifference', 'BOOLEAN')
-                md.operation = 'DIFFERENCE'
-                md.object = SelectedObject       
-                # apply the modifier
-                bpy.ops.object.modifier_apply(apply_as='DATA', modifier="booleandifference")
-                bpy.data.scenes[0].objects.unlink(SelectedObject)
-                bpy.data.objects.remove(SelectedObject)
-        
+        booleanMulti(self, context, 'DIFFERENCE')
         return {'FINISHED'}
 
 class BooleanIntersectOperator(bpy.types.Operator):
@@ -78,27 +594,7 @@ class BooleanIntersectOperator(bpy.types.Operator):
 
     def execute(self, context):
         # add a intersect boolean modifier
-        activeObj = context.active_object
-        for SelectedObject in bpy.context.selected_objects :
-            if SelectedObject != activeObj :
-                
-                #deselect all the faces of the active object
-                helper.objSelectFaces(activeObj, 'DESELECT')
-
-                #select all the faces of the selected object
-                helper.objSelectFaces(SelectedObject, 'SELECT')
-                
-                bpy.context.scene.objects.active = activeObj
-
-                md = activeObj.modifiers.new('booleanintersect', 'BOOLEAN')
-                md.operation = 'INTERSECT'
-                md.object = SelectedObject       
-                
-                # apply the modifier
-                bpy.ops.object.modifier_apply(apply_as='DATA', modifier="booleanintersect")
-                bpy.data.scenes[0].objects.unlink(SelectedObject)
-                bpy.data.objects.remove(SelectedObject)
-        
+        booleanMulti(self, context, 'INTERSECT')
         return {'FINISHED'}
 
 class BooleanCloneOperator(bpy.types.Operator):
@@ -114,25 +610,34 @@ class BooleanCloneOperator(bpy.types.Operator):
     def execute(self, context):
         # add a intersect boolean modifier
         activeObj = context.active_object
-        for SelectedObject in bpy.context.selected_objects :
-            if SelectedObject != activeObj :
-                
-                #deselect all the faces of the active object
-                helper.objSelectFaces(activeObj, 'DESELECT')
-
-                #select all the faces of the selected object
-                helper.objSelectFaces(SelectedObject, 'SELECT')
-
-                md = SelectedObject.modifiers.new('booleanclone', 'BOOLEAN')
-                md.operation = 'INTERSECT'
-                md.object = activeObj       
-                
-                # apply the modifier
-                bpy.context.scene.objects.active = SelectedObject
-                bpy.ops.object.modifier_apply(apply_as='DATA', modifier="booleanclone")
-                
-                #restore the active object
-                bpy.context.scene.objects.active = activeObj
+        # the active object is restored at the end
+        with helper.ModeState():
+            for SelectedObject in bpy.context.selected_objects :
+                if SelectedObject != activeObj :
+                    
+                    #deselect all the faces of the active object
+                    helper.meshSelectFaces(activeObj.data, 'DESELECT')
+
+                    #select all the faces of the selected object
+                    helper.meshSelectFaces(SelectedObject.data, 'SELECT')
+
+                    if booleanShortcut(SelectedObject, activeObj, 'INTERSECT'):
+                        helper.counters['boolean_skipped'] += 1
+                        self.report({'INFO'}, "Solver call skipped, the meshes didn't touch")
+                        continue
+                    
+                    # only the part of the active object around the selected one is cut
+                    if context.window_manager.booleanLocal and booleanLocal(context, activeObj, SelectedObject, 'INTERSECT'):
+                        helper.counters['boolean_localized'] += 1
+                        continue
+
+                    md = SelectedObject.modifiers.new('booleanclone', 'BOOLEAN')
+                    md.operation = 'INTERSECT'
+                    md.object = activeObj       
+                    
+                    # apply the modifier
+                    helper.setActive(SelectedObject)
+                    helper.modifierApply("booleanclone")
         
         return {'FINISHED'}
 
@@ -142,56 +647,26 @@ class BooleanSeparateOperator(bpy.types.Operator):
     bl_label = "Boolean separation"
     bl_options = {'REGISTER', 'UNDO'}
 
+    method = bpy.props.EnumProperty(
+        name="Method",
+        items=(("SINGLE", "Single Pass", "Cut both meshes once and sort the pieces, without copies of the objects"),
+               ("MODIFIER", "Modifiers", "Intersect and difference boolean modifiers on copies of both objects")),
+        default="SINGLE")
+
     @classmethod
     def poll(cls, context):
         return context.active_object is not None and len(bpy.context.selected_objects)==2
 
     def execute(self, context):
-        # add a intersect boolean modifier
         activeObj = context.active_object
-        Selection = bpy.context.selected_objects
         
-        for SelectedObject in Selection :
+        for SelectedObject in bpy.context.selected_objects :
             if SelectedObject != activeObj :
-                
-                #make a copy of the selected object
-                SelectedObjCopy = helper.objDuplicate(SelectedObject)
-                
-                #make a copy of the active object
-                activeObjCopy = helper.objDuplicate(activeObj)
-
-                helper.objSelectFaces(activeObjCopy, 'SELECT')
-                helper.objSelectFaces(SelectedObject, 'DESELECT')
-                
-                
-                md = SelectedObject.modifiers.new('sepIntersect', 'BOOLEAN')
-                md.operation = 'INTERSECT'
-                md.object = activeObjCopy
-                # apply the modifier 
-                bpy.context.scene.objects.active = SelectedObject
-                bpy.ops.object.modifier_apply(apply_as='DATA', modifier="sepIntersect")
-                
-                helper.objSelectFaces(SelectedObject, 'INVERT')
-                
-                #delete the copy of the active object
-                bpy.data.scenes[0].objects.unlink(activeObjCopy)
-                bpy.data.objects.remove(activeObjCopy)
-        
-        helper.objSelectFaces(SelectedObjCopy, 'SELECT')
-        helper.objSelectFaces(activeObj, 'DESELECT')
-   
-        md2 = activeObj.modifiers.new('sepDifference', 'BOOLEAN')
-        md2.operation = 'DIFFERENCE'
-        md2.object = SelectedObjCopy
-        
-        #apply the second modifier
-        bpy.context.scene.objects.active = SelectedObject
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier="sepDifference")
-        
-        #delete the copy of the selected object
-        bpy.data.scenes[0].objects.unlink(SelectedObjCopy)
-        bpy.data.objects.remove(SelectedObjCopy)
+                if self.method == 'SINGLE' and separateSinglePossible(activeObj, SelectedObject):
+                    separateSingle(context, activeObj, SelectedObject)
+                else:
+                    separateModifiers(activeObj, SelectedObject)
         
         bpy.context.active_object.select = True
         
-        return {'FINISHED'}
\ No newline at end of file
+        return {'FINISHED'}
@@ -1,22 +1,138 @@
 import bpy
-# import mathutils
 import bmesh
-from . import helper, booleanOps
+import numpy as np
+from mathutils import Vector
+from . import helper, booleanOps, strokeCut, profiling
+
+# world space vertex positions of the object's mesh
+def objWorldCo(obj):
+    co = np.empty(len(obj.data.vertices)*3, dtype=np.float32)
+    obj.data.vertices.foreach_get('co', co)
+    matrix = np.array(obj.matrix_world)
+    return co.reshape(-1, 3).dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+# Replaces the stroke edges of the ruler with the cutter: the stroke swept along the view axis
+# across the depth the target actually covers, split into the given number of segments
+@profiling.stage("cutter")
+def cutterPrism(ruler, target, viewZAxis, segments):
+    viewZ = np.array(viewZAxis.normalized())
+    strokeCo = objWorldCo(ruler)
+    edges = np.empty(len(ruler.data.edges)*2, dtype=np.int32)
+    ruler.data.edges.foreach_get('vertices', edges)
+    edges = edges.reshape(-1, 2)
+    
+    # depth range of the target along the view ray, with a little margin so the caps don't touch it
+    targetDepths = objWorldCo(target).dot(viewZ)
+    margin = 0.01*(targetDepths.max()-targetDepths.min()) + 1e-4
+    near = targetDepths.max() + margin
+    far = targetDepths.min() - margin
+    
+    # flatten the stroke onto the near plane, then step towards the far plane
+    base = strokeCo + np.outer(near - strokeCo.dot(viewZ), viewZ)
+    steps = np.linspace(0.0, near-far, segments+1)
+    co = (base[None, :, :] - steps[:, None, None]*viewZ).reshape(-1, 3)
+    
+    count = len(strokeCo)
+    layer = np.arange(segments)[:, None]*count
+    a = (edges[None, :, 0] + layer).ravel()
+    b = (edges[None, :, 1] + layer).ravel()
+    loopVerts = np.column_stack((a, b, b+count, a+count)).ravel().astype(np.int32)
+    loopTotal = np.full(len(a), 4, dtype=np.int32)
+    
+    matrix = np.array(ruler.matrix_world.inverted())
+    co = co.dot(matrix[:3, :3].T) + matrix[:3, 3]
+    helper.meshFromArrays(ruler.data, co, loopTotal, loopVerts)
+    
+    bm = bmesh.new()
+    bm.from_mesh(ruler.data)
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+    bm.to_mesh(ruler.data)
+    bm.free()
+
+# writes the pieces of a stroke partition back: the piece outside every stroke stays in the object,
+# every other piece becomes a copy of it. Returns the new objects
+@profiling.stage("write pieces")
+def writePieces(context, ob, pieces, fill):
+    newObjects = []
+    keep = min(piece[0] for piece in pieces)
+    for piece in pieces:
+        if piece[0] == keep:
+            strokeCut.pieceToMesh(ob.data, piece, fill)
+            continue
+        pieceObj = ob.copy()
+        pieceObj.data = bpy.data.meshes.new(ob.data.name)
+        for mat in ob.data.materials:
+            pieceObj.data.materials.append(mat)
+        strokeCut.pieceToMesh(pieceObj.data, piece, fill)
+        context.scene.objects.link(pieceObj)
+        newObjects.append(pieceObj)
+    return newObjects
+
+# the labels of a partition are bit masks, one bit per stroke
+maxStrokes = 31
+
+# the partition rebuilds the mesh from arrays, which would lose vertex groups and shape keys
+def partitionPossible(ob):
+    return len(ob.vertex_groups) == 0 and ob.data.shape_keys is None
+
+# world space points of the 3D strokes on the active grease pencil layer, the object's pencil first
+def pencilStrokes(context):
+    for gpencil in (context.active_object.grease_pencil, context.scene.grease_pencil):
+        if gpencil is None or gpencil.layers.active is None or gpencil.layers.active.active_frame is None:
+            continue
+        strokes = [np.array([point.co[:] for point in stroke.points]) for stroke in gpencil.layers.active.active_frame.strokes
+                   if stroke.draw_mode == '3DSPACE' and len(stroke.points) > 2]
+        if strokes:
+            return strokes
+    return []
+
+def viewMatrix(context):
+    for area in context.screen.areas:
+        if area.type == 'VIEW_3D':
+            return area.spaces[0].region_3d.view_matrix.copy()
+    return None
 
 class GreaseTrim(bpy.types.Operator):
-    """Cuts the selected object along the grease pencil stroke"""
+    """Cuts the selected object along the grease pencil strokes"""
     bl_idname = "boolean.grease_trim"
     bl_label = "Grease Cut"
     bl_options = {'REGISTER', 'UNDO'}
+    
+    method = bpy.props.EnumProperty(name="Method",
+                     items = (("PARTITION","Partition","Split only the faces along the stroke"),
+                              ("BOOLEAN","Boolean","Cut with a boolean separate")),
+                     default = "PARTITION")
+    fill = bpy.props.BoolProperty(name="Fill Cut", default = True)
+    subdivisions = bpy.props.IntProperty(name="Segments", min = 1, max = 64, default = 32)
 
     @classmethod 
     def poll(cls, context):
         return context.active_object is not None and context.active_object.mode == 'OBJECT' and context.active_object.type == 'MESH'  and 0<len(bpy.context.selected_objects)<=2
 
     def execute(self, context):
-        objBBDiagonal = helper.objDiagonal(context.active_object)*2
-        # objBBDiagonal = objBBDiagonal*2
-        subdivisions = 32
+        method = self.method
+        if method == 'PARTITION' and not partitionPossible(context.active_object):
+            self.report({'INFO'}, "Vertex groups or shape keys, cutting with a boolean instead")
+            method = 'BOOLEAN'
+        
+        # every stroke on the layer is cut in one go, each resulting piece becomes its own object
+        if method == 'PARTITION' and len(bpy.context.selected_objects)==1:
+            mesh = context.active_object
+            strokes = pencilStrokes(context)
+            if not strokes:
+                self.report({'WARNING'}, "Draw a line with grease pencil first")
+                return {'FINISHED'}
+            if len(strokes) > maxStrokes:
+                self.report({'WARNING'}, "Only the first %d strokes are used" % maxStrokes)
+                strokes = strokes[:maxStrokes]
+            bpy.ops.boolean.purge_pencils()
+            
+            pieces = strokeCut.strokePartition(mesh, strokes, viewMatrix(context))
+            if len(pieces) > 1:
+                for pieceObj in writePieces(context, mesh, pieces, self.fill):
+                    pieceObj.select = True
+            self.report({'INFO'}, "%d strokes, %d pieces" % (len(strokes), len(pieces)))
+            return {'FINISHED'}
 
         if len(bpy.context.selected_objects)==1:
             try:
@@ -28,7 +144,7 @@ class GreaseTrim(bpy.types.Operator):
                     ruler = bpy.context.selected_objects[1]
                 else: 
                     ruler = bpy.context.selected_objects[0]
-                bpy.context.scene.objects.active = ruler
+                helper.setActive(ruler)
                 bpy.ops.object.convert(target='MESH')
                 
                 rulerDiagonal = helper.objDiagonal(ruler)
@@ -59,38 +175,40 @@ class GreaseTrim(bpy.types.Operator):
                 ruler = bpy.context.selected_objects[0]
             
             if ruler.type == 'MESH' and len(ruler.data.polygons)>0:
-                bpy.context.scene.objects.active = ruler
-                bpy.ops.object.mode_set(mode='EDIT')
+                helper.setActive(ruler)
+                helper.modeSet('EDIT')
                 bpy.ops.mesh.select_mode(type="EDGE")
                 bpy.ops.mesh.select_all(action='SELECT')
                 bpy.ops.mesh.region_to_loop()
                 bpy.ops.mesh.select_all(action='INVERT')
                 bpy.ops.mesh.delete(type='EDGE')
-                bpy.ops.object.mode_set(mode='OBJECT')
+                helper.modeSet('OBJECT')
             elif ruler.type == 'CURVE':
-                bpy.context.scene.objects.active = ruler
+                helper.setActive(ruler)
                 bpy.ops.object.convert(target='MESH')
             
 
 
-        for area in bpy.context.screen.areas:
-            if area.type == 'VIEW_3D':
-                viewZAxis = tuple([z * objBBDiagonal for z in area.spaces[0].region_3d.view_matrix[2][0:3]])
-                negViewZAxis = tuple([z * (-2*objBBDiagonal*(1/subdivisions)) for z in area.spaces[0].region_3d.view_matrix[2][0:3]])
-                break
+        view = viewMatrix(context)
+        viewZAxis = Vector(view[2][0:3])
         
-        bpy.context.scene.objects.active = ruler
-
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.select_mode(type="EDGE")
-        bpy.ops.transform.translate(value = viewZAxis)
-        for i in range(0, subdivisions):
-            bpy.ops.mesh.extrude_region_move(TRANSFORM_OT_translate={"value":negViewZAxis})
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent()
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.context.scene.objects.active = mesh
+        if method == 'PARTITION':
+            edges = np.empty(len(ruler.data.edges)*2, dtype=np.int32)
+            ruler.data.edges.foreach_get('vertices', edges)
+            stroke = objWorldCo(ruler)[strokeCut.edgeLoopOrder(edges.reshape(-1, 2).tolist())]
+            helper.objDelete(ruler)
+            
+            pieces = strokeCut.strokePartition(mesh, [stroke], view)
+            if len(pieces) > 1:
+                for pieceObj in writePieces(context, mesh, pieces, self.fill):
+                    pieceObj.select = True
+            helper.setActive(mesh)
+            mesh.select = True
+            return {'FINISHED'}
+        
+        cutterPrism(ruler, mesh, viewZAxis, self.subdivisions)
+        
+        helper.setActive(mesh)
         bpy.ops.boolean.separate()
     
         return {'FINISHED'}
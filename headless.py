@@ -0,0 +1,24 @@
+# Loads the add-on from this directory into a headless Blender, for the scripts that run with
+#   blender -b --factory-startup --python <script>.py
+# The directory doesn't need to be installed as an add-on, it is imported as the sculpt_tools package and registered.
+import os
+import sys
+import importlib.util
+
+packageName = "sculpt_tools"
+
+def loadAddon():
+    if packageName in sys.modules:
+        return sys.modules[packageName]
+    directory = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(packageName, os.path.join(directory, "__init__.py"),
+                                                  submodule_search_locations=[directory])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[packageName] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+    return addon
+
+# the script's own arguments, everything after --
+def scriptArgs():
+    return sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
@@ -1,42 +1,369 @@
 import bpy
+import bmesh
+import collections
+import numpy as np
+from mathutils.bvhtree import BVHTree
+from mathutils.kdtree import KDTree
+
+# how often the operators went through the expensive operator calls below, read by the profiler
+counters = collections.Counter()
+
+# Every mode switch rebuilds the mesh, so inside a ModeState the switches are only recorded and made once
+# something needs the mode (modeFlush). Switches that cancel out or end where they started are never made,
+# they are counted as mode_set_elided. Only the active object can be out of object mode.
+modeStates = []
+
+def activeMode():
+    ob = bpy.context.scene.objects.active
+    return ob.mode if ob is not None else 'OBJECT'
+
+def modeSwitch(mode):
+    counters['mode_set'] += 1
+    bpy.ops.object.mode_set(mode=mode)
+
+def modeSet(mode):
+    if modeStates:
+        modeStates[0].pending = mode
+        modeStates[0].requests += 1
+    elif activeMode() != mode:
+        modeSwitch(mode)
+    else:
+        counters['mode_set_elided'] += 1
+
+# makes the mode switch that is still pending, call it before anything that depends on the mode
+def modeFlush():
+    if not modeStates:
+        return
+    state = modeStates[0]
+    switched = 0
+    if state.pending is not None and activeMode() != state.pending:
+        modeSwitch(state.pending)
+        switched = 1
+    counters['mode_set_elided'] += max(state.requests-switched, 0)
+    state.pending = None
+    state.requests = 0
+
+def setActive(ob):
+    scene = bpy.context.scene
+    if scene.objects.active == ob:
+        return
+    modeFlush()
+    # the object losing focus has to leave edit or sculpt mode first
+    if activeMode() != 'OBJECT':
+        modeSwitch('OBJECT')
+    scene.objects.active = ob
+
+# Keeps track of the active object and its mode for the block, and puts both back once at the end.
+# Nested states hand their pending switch to the outermost one
+class ModeState:
+    def __init__(self, restore = True):
+        self.restore = restore
+        self.pending = None
+        self.requests = 0
+
+    def __enter__(self):
+        self.active = bpy.context.scene.objects.active
+        self.mode = activeMode()
+        modeStates.append(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if self.restore:
+            try:
+                setActive(self.active)
+                modeSet(self.mode)
+            except ReferenceError:
+                # the object was deleted on the way
+                pass
+        if len(modeStates) == 1:
+            modeFlush()
+        modeStates.pop()
+        return False
+
+# applies a modifier of the active object to its mesh data
+def modifierApply(name):
+    modeFlush()
+    counters['modifier_apply'] += 1
+    bpy.ops.object.modifier_apply(apply_as='DATA', modifier=name)
+
+# data-level face selection. Writes the select flags straight into the mesh,
+# so there is no mode switch and the active object stays the same
+def meshSelectFaces(mesh, mode):
+    
+    # in edit mode the BMesh owns the selection, writing to the mesh would be overwritten on exit
+    if mesh.is_editmode:
+        bm = bmesh.from_edit_mesh(mesh)
+        for face in bm.faces:
+            face.select_set(not face.select if mode == 'INVERT' else mode == 'SELECT')
+        bmesh.update_edit_mesh(mesh, tessface=False, destructive=False)
+        return
+    
+    faceCount = len(mesh.polygons)
+    if mode == 'INVERT':
+        faceSel = np.empty(faceCount, dtype=np.int32)
+        mesh.polygons.foreach_get('select', faceSel)
+        faceSel = 1 - faceSel
+        
+        # flush the face selection down to the vertices and edges like edit mode does
+        loopTotal = np.empty(faceCount, dtype=np.int32)
+        mesh.polygons.foreach_get('loop_total', loopTotal)
+        loopVerts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loopVerts)
+        vertSel = np.zeros(len(mesh.vertices), dtype=np.int32)
+        vertSel[loopVerts[np.repeat(faceSel, loopTotal) == 1]] = 1
+        edgeVerts = np.empty(len(mesh.edges)*2, dtype=np.int32)
+        mesh.edges.foreach_get('vertices', edgeVerts)
+        edgeSel = vertSel[edgeVerts].reshape(-1, 2).min(axis=1)
+    else:
+        value = 1 if mode == 'SELECT' else 0
+        faceSel = np.full(faceCount, value, dtype=np.int32)
+        vertSel = np.full(len(mesh.vertices), value, dtype=np.int32)
+        edgeSel = np.full(len(mesh.edges), value, dtype=np.int32)
+    
+    mesh.vertices.foreach_set('select', vertSel)
+    mesh.edges.foreach_set('select', edgeSel)
+    mesh.polygons.foreach_set('select', faceSel)
 
 # helper function for face selection
 def objSelectFaces(obj, mode):
+    meshSelectFaces(obj.data, mode)
+
+#helper function to duplicate an object at the datablock level, without operators or selection changes
+def objDuplicate(obj):
     
-    #store active object
-    activeObj = bpy.context.active_object
+    # edit mode changes only reach the mesh on exit
+    if obj.mode == 'EDIT':
+        obj.update_from_editmode()
     
-    #store the mode of the active object
-    oldMode = activeObj.mode
+    objCopy = obj.copy()
+    objCopy.data = obj.data.copy()
+    bpy.context.scene.objects.link(objCopy)
+    return objCopy
+
+# vertex positions, polygon sizes and polygon vertex indices of the mesh as NumPy arrays
+def meshToArrays(mesh):
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    loopTotal = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loopTotal)
+    loopVerts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loopVerts)
+    return co.reshape(-1, 3), loopTotal, loopVerts
+
+# replaces the geometry of the mesh with the given arrays, materials are kept
+def meshFromArrays(mesh, co, loopTotal, loopVerts):
+    bm = bmesh.new()
+    bm.to_mesh(mesh)
+    bm.free()
     
-    #perform selection
-    bpy.context.scene.objects.active = obj
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action=mode)
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
     
-    #restore old active object and mode
-    bpy.ops.object.mode_set(mode=oldMode)
-    bpy.context.scene.objects.active = activeObj
+    mesh.vertices.add(len(co))
+    mesh.loops.add(len(loopVerts))
+    mesh.polygons.add(len(loopTotal))
+    mesh.vertices.foreach_set('co', np.ascontiguousarray(co, dtype=np.float32).ravel())
+    mesh.loops.foreach_set('vertex_index', np.ascontiguousarray(loopVerts, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_start', loopStart)
+    mesh.polygons.foreach_set('loop_total', np.ascontiguousarray(loopTotal, dtype=np.int32))
+    mesh.update(calc_edges=True)
 
-#helper function to duplicate an object    
-def objDuplicate(obj):
+# keeps the faces picked by faceMask and the vertices they use, returns the new arrays
+# and the indices of the kept vertices in the old mesh
+def meshSubset(co, loopTotal, loopVerts, faceMask):
+    subLoopVerts = loopVerts[np.repeat(faceMask, loopTotal)]
+    used = np.zeros(len(co), dtype=bool)
+    used[subLoopVerts] = True
+    remap = np.cumsum(used, dtype=np.int32) - 1
+    return co[used], loopTotal[faceMask], remap[subLoopVerts], np.flatnonzero(used)
 
-    activeObj = bpy.context.active_object
-    oldMode = activeObj.mode    
+# index of the next corner of the same face for every loop
+def loopNext(loopTotal):
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    nextLoop = np.arange(1, int(loopTotal.sum())+1)
+    nextLoop[loopStart + loopTotal - 1] = loopStart
+    return nextLoop
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action = 'DESELECT')
-    bpy.ops.object.select_pattern(pattern = obj.name)
-    bpy.ops.object.duplicate()
-    objCopy = bpy.context.selected_objects[0]
+# drops corners that repeat the vertex before them and faces left with less than three corners, as welding leaves
+# them. Returns the new arrays and masks of the kept loops and faces of the old ones
+def meshCollapse(co, loopTotal, loopVerts):
+    if len(loopTotal) == 0:
+        return co, loopTotal, loopVerts, np.ones(0, dtype=bool), np.ones(0, dtype=bool)
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    keepLoops = loopVerts != loopVerts[loopNext(loopTotal)]
+    cornerTotal = np.add.reduceat(keepLoops.astype(np.int32), loopStart)
+    faceMask = cornerTotal >= 3
+    loopMask = keepLoops & np.repeat(faceMask, loopTotal)
+    co, loopTotal, loopVerts, used = meshSubset(co, cornerTotal, loopVerts[keepLoops], faceMask)
+    return co, loopTotal, loopVerts, loopMask, faceMask
 
-    bpy.context.scene.objects.active = activeObj
-    bpy.ops.object.mode_set(mode=oldMode)
-    return objCopy
+# connected parts of the mesh as a label per vertex, the lowest vertex index of the part.
+# Edges hook the higher root under the lower one, then every vertex jumps straight to its root
+def vertIslands(vertCount, loopTotal, loopVerts):
+    a = loopVerts
+    b = loopVerts[loopNext(loopTotal)]
+    parent = np.arange(vertCount)
+    while True:
+        rootA = parent[a]
+        rootB = parent[b]
+        hook = rootA != rootB
+        if not hook.any():
+            return parent
+        np.minimum.at(parent, np.maximum(rootA, rootB)[hook], np.minimum(rootA, rootB)[hook])
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+
+# vertices on edges used by a single face
+def boundaryVerts(vertCount, loopTotal, loopVerts):
+    a = loopVerts.astype(np.int64)
+    b = loopVerts[loopNext(loopTotal)].astype(np.int64)
+    keys, counts = np.unique(np.minimum(a, b)*vertCount + np.maximum(a, b), return_counts=True)
+    open = keys[counts == 1]
+    boundary = np.zeros(vertCount, dtype=bool)
+    boundary[open // vertCount] = True
+    boundary[open % vertCount] = True
+    return boundary
+
+# every edge has exactly two faces, so the mesh has a well defined inside
+def meshClosed(mesh):
+    co, loopTotal, loopVerts = meshToArrays(mesh)
+    if len(loopTotal) == 0:
+        return False
+    a = loopVerts.astype(np.int64)
+    b = loopVerts[loopNext(loopTotal)].astype(np.int64)
+    keys, counts = np.unique(np.minimum(a, b)*len(co) + np.maximum(a, b), return_counts=True)
+    return bool((counts == 2).all())
+
+# vertex colour and UV layers as (collection name, layer name, per loop array), meshFromArrays drops them
+def meshLoopLayers(mesh):
+    layers = []
+    for kind, attribute, width in (('vertex_colors', 'color', 3), ('uv_layers', 'uv', 2)):
+        for layer in getattr(mesh, kind):
+            # colours have an alpha from 2.79 on
+            if len(layer.data) > 0:
+                width = len(getattr(layer.data[0], attribute))
+            data = np.empty(len(mesh.loops)*width, dtype=np.float32)
+            layer.data.foreach_get(attribute, data)
+            layers.append((kind, layer.name, data.reshape(-1, width)))
+    return layers
+
+def meshSetLoopLayers(mesh, layers):
+    for kind, name, data in layers:
+        if kind == 'vertex_colors':
+            mesh.vertex_colors.new(name)
+            mesh.vertex_colors[name].data.foreach_set('color', np.ascontiguousarray(data, dtype=np.float32).ravel())
+        else:
+            # the UV loop layer comes with the texture face layer
+            mesh.uv_textures.new(name)
+            mesh.uv_layers[name].data.foreach_set('uv', np.ascontiguousarray(data, dtype=np.float32).ravel())
+
+# index of the vertex every vertex merges into. Only the vertices in subset are looked at, the first
+# vertex of a cluster takes in every vertex within distance that isn't part of a cluster yet
+def weldVerts(co, subset, distance):
+    target = np.arange(len(co))
+    tree = KDTree(len(subset))
+    for i in subset:
+        tree.insert(co[i], int(i))
+    tree.balance()
+    done = np.zeros(len(co), dtype=bool)
+    for i in subset:
+        if done[i]:
+            continue
+        for point, j, dist in tree.find_range(co[i], distance):
+            if not done[j]:
+                target[j] = i
+                done[j] = True
+    return target
+
+# sculpt mask value of every vertex, None if the mesh has no mask
+def meshMask(mesh):
+    mask = np.empty(len(mesh.vertices), dtype=np.float32)
+    if hasattr(mesh, 'vertex_paint_masks'):
+        if len(mesh.vertex_paint_masks) == 0:
+            return None
+        mesh.vertex_paint_masks[0].data.foreach_get('value', mask)
+        return mask
+    
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    layer = bm.verts.layers.paint_mask.active
+    if layer is not None:
+        mask[:] = [v[layer] for v in bm.verts]
+    bm.free()
+    return mask if layer is not None else None
+
+# BVH of the mesh surface in object space. It holds only triangles and positions,
+# so it is much lighter than keeping a copy of the object around
+def meshBVH(mesh):
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bvh = BVHTree.FromBMesh(bm)
+    bm.free()
+    return bvh
+
+# the object's named modifiers evaluated into a new mesh and removed, the object's mesh stays as it is.
+# The other modifiers are left out, as applying the named ones would
+def objEvaluate(ob, names):
+    disabled = [md for md in ob.modifiers if md.show_viewport and md.name not in names]
+    for md in disabled:
+        md.show_viewport = False
+    counters['to_mesh'] += 1
+    mesh = ob.to_mesh(bpy.context.scene, True, 'PREVIEW', calc_tessface=False)
+    for name in names:
+        ob.modifiers.remove(ob.modifiers[name])
+    for md in disabled:
+        md.show_viewport = True
+    return mesh
+
+# Projects every vertex of the mesh along its normal, both ways, onto the object's surface with a PROJECT
+# shrinkwrap, then makes it the object's mesh. The object itself is the shrinkwrap target, so its surface
+# never has to be copied
+def objProject(ob, mesh):
+    scene = bpy.context.scene
+    holder = bpy.data.objects.new(mesh.name, mesh)
+    holder.matrix_world = ob.matrix_world
+    scene.objects.link(holder)
+    
+    # the target is its mesh as stored, like the mesh the remesh started from
+    disabled = [md for md in ob.modifiers if md.show_viewport]
+    for md in disabled:
+        md.show_viewport = False
+    scene.update()
+    
+    md = holder.modifiers.new('RemeshShrinkwrap', 'SHRINKWRAP')
+    md.wrap_method = 'PROJECT'
+    md.use_negative_direction = True
+    md.use_positive_direction = True
+    md.target = ob
+    setActive(holder)
+    modifierApply("RemeshShrinkwrap")
+    for md in disabled:
+        md.show_viewport = True
+    
+    source = ob.data
+    ob.data = mesh
+    scene.objects.unlink(holder)
+    bpy.data.objects.remove(holder)
+    if source.users == 0:
+        name = source.name
+        bpy.data.meshes.remove(source)
+        mesh.name = name
+    setActive(ob)
     
 def objDiagonal(obj):
     return ((obj.dimensions[0]**2)+(obj.dimensions[1]**2)+(obj.dimensions[2]**2))**0.5
     
+# surface area of the mesh in object space
+def meshArea(mesh):
+    area = np.empty(len(mesh.polygons), dtype=np.float32)
+    mesh.polygons.foreach_get('area', area)
+    return float(area.sum())
+    
 def objDelete(obj):
     rem = obj
     remname = rem.data.name
@@ -1,4 +1,136 @@
 import bpy
+import zlib
+import bmesh
+import numpy as np
+from . import helper, smooth, profiling
+
+# faces with any vertex masked above this are extracted, the same faces Hide Masked would hide
+maskThreshold = 0.5
+
+# builds the masked part of the object as arrays without leaving sculpt mode, None if nothing is masked
+@profiling.stage("extract")
+def extractMaskedFaces(context, sourceObj):
+    mesh = sourceObj.data
+    
+    # for multires the mask lives on the evaluated mesh
+    evaluated = None
+    if "Multires" in sourceObj.modifiers:
+        evaluated = sourceObj.to_mesh(context.scene, True, 'PREVIEW', calc_tessface=False)
+        mesh = evaluated
+    
+    mask = helper.meshMask(mesh)
+    co, loopTotal, loopVerts = helper.meshToArrays(mesh)
+    smoothFlags = np.empty(len(loopTotal), dtype=np.int32)
+    mesh.polygons.foreach_get('use_smooth', smoothFlags)
+    materials = np.empty(len(loopTotal), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', materials)
+    
+    if evaluated is not None:
+        bpy.data.meshes.remove(evaluated)
+    if mask is None or len(loopTotal) == 0:
+        return None
+    
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    faceMask = np.logical_or.reduceat(mask[loopVerts] > maskThreshold, loopStart)
+    if not faceMask.any():
+        return None
+    
+    co, loopTotal, loopVerts, _ = helper.meshSubset(co, loopTotal, loopVerts, faceMask)
+    return co, loopTotal, loopVerts, smoothFlags[faceMask], materials[faceMask]
+
+# the last base extraction and the fingerprint it was made from, so redo only reruns the style stage.
+# Only one entry is kept to avoid holding on to several high-poly meshes
+extractCache = {}
+
+# identifies the source geometry and mask
+def extractFingerprint(sourceObj):
+    mesh = sourceObj.data
+    if "Multires" in sourceObj.modifiers:
+        # the multires displacement and mask are only visible on the evaluated mesh
+        return (sourceObj.name, mesh.name, "Multires")
+    
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    crc = zlib.crc32(co.tobytes())
+    mask = helper.meshMask(mesh)
+    if mask is not None:
+        crc = zlib.crc32(mask.tobytes(), crc)
+    return (sourceObj.name, mesh.name, len(mesh.vertices), len(mesh.polygons), crc)
+
+def extractCached(context, sourceObj, isRedo):
+    fingerprint = extractFingerprint(sourceObj)
+    # a multires fingerprint can't see sculpting, so it is only trusted while redoing
+    if extractCache.get("fingerprint") == fingerprint and (isRedo or fingerprint[-1] != "Multires"):
+        return extractCache["extracted"]
+    
+    extracted = extractMaskedFaces(context, sourceObj)
+    extractCache.clear()
+    if extracted is not None:
+        extractCache["fingerprint"] = fingerprint
+        extractCache["extracted"] = extracted
+    return extracted
+
+# moves every vertex along its normal
+def meshOffset(mesh, distance):
+    if distance == 0:
+        return
+    mesh.calc_normals()
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    no = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    mesh.vertices.foreach_get('normal', no)
+    mesh.vertices.foreach_set('co', co + no*distance)
+    mesh.update()
+
+# runs a bmesh operator on the whole mesh, faces get consistent normals afterwards
+def meshBmeshOp(mesh, op, **kwargs):
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    if op is not None:
+        op(bm, **kwargs)
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+    bm.to_mesh(mesh)
+    bm.free()
+
+# offset, smoothing and thickness of the extracted mesh
+@profiling.stage("style")
+def extractStyle(mesh, wm):
+    depth = wm.extractDepthFloat
+    iterations = wm.extractSmoothIterationsInt
+    
+    meshBmeshOp(mesh, None)
+    
+    # Solid mode should create a two-sided mesh
+    if wm.extractStyleEnum == 'SOLID':
+        meshOffset(mesh, -wm.extractOffsetFloat)
+        smooth.meshSmooth(mesh, iterations, pinBorder = True) #smooth everything but border edges to sanitize normals
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bmesh.ops.solidify(bm, geom=bm.faces[:], thickness=-depth)
+        bm.to_mesh(mesh)
+        bm.free()
+        smooth.meshSmooth(mesh, iterations)
+        meshBmeshOp(mesh, None)
+        
+    elif wm.extractStyleEnum == 'SINGLE':
+        meshOffset(mesh, -wm.extractOffsetFloat)
+        smooth.meshSmooth(mesh, iterations, pinBorder = True) #smooth everything but border edges to sanitize normals
+        # This is to create an extra loop and prevent the bottom vertices running up too far in smoothing
+        # Tried multiple ways to prevent this and this one seemed best
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bmesh.ops.inset_region(bm, faces=bm.faces[:], thickness=0, depth=depth/1000, use_boundary=True, use_even_offset=True)
+        bmesh.ops.inset_region(bm, faces=bm.faces[:], thickness=0, depth=depth-(depth/1000), use_boundary=True, use_even_offset=True)
+        bm.to_mesh(mesh)
+        bm.free()
+        smooth.meshSmooth(mesh, iterations)
+        meshBmeshOp(mesh, None)
+        
+    elif wm.extractStyleEnum == 'FLAT':
+        # Offset doesn't make much sense for Flat mode, so let's add it to the depth to make it a single op.
+        meshOffset(mesh, -depth-wm.extractOffsetFloat)
+        smooth.meshSmooth(mesh, iterations)
 
 class MaskExtractOperator(bpy.types.Operator):
     """Extracts the masked area into a new mesh"""
@@ -25,122 +157,39 @@ class MaskExtractOperator(bpy.types.Operator):
         # This is a hackish way to support redo functionality despite sculpt mode having its own undo system.
         # The set of conditions here is not something the user can create manually from the UI.
         # Unfortunately I haven't found a way to make Undo itself work
-        if  2>len(bpy.context.selected_objects)>0 and \
+        isRedo = 2>len(bpy.context.selected_objects)>0 and \
             context.selected_objects[0] != activeObj and \
-            context.selected_objects[0].name.startswith("Extracted."):
-            rem = context.selected_objects[0]
-            remname = rem.data.name
-            bpy.data.scenes[0].objects.unlink(rem)
-            bpy.data.objects.remove(rem)
+            context.selected_objects[0].name.startswith("Extracted.")
+        if isRedo:
             # remove mesh to prevent memory being cluttered up with hundreds of high-poly objects
-            bpy.data.meshes.remove(bpy.data.meshes[remname])
-        
-        # For multires we need to copy the object and apply the modifiers
-        try:
-            if activeObj.modifiers["Multires"]:
-                use_multires = True
-                objCopy = helper.objDuplicate(activeObj)
-                bpy.context.scene.objects.active = objCopy
-                bpy.ops.object.mode_set(mode='OBJECT')
-                bpy.ops.boolean.mod_apply()
-        except:
-            use_multires = False
-            pass
-            
-        bpy.ops.object.mode_set(mode='EDIT')
+            helper.objDelete(context.selected_objects[0])
         
-        # Automerge will collapse the mesh so we need it off.
-        if context.scene.tool_settings.use_mesh_automerge:
-            automerge = True
-            bpy.data.scenes[context.scene.name].tool_settings.use_mesh_automerge = False
-        else:
-            automerge = False
-
-        # Until python can read sculpt mask data properly we need to rely on the hiding trick
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent();
-        bpy.ops.mesh.select_all(action='DESELECT')
-        bpy.ops.object.mode_set(mode='SCULPT')
-        bpy.ops.paint.hide_show(action='HIDE', area='MASKED')
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.select_mode(type="FACE")
-        bpy.ops.mesh.reveal()
-        bpy.ops.mesh.duplicate_move(MESH_OT_duplicate=None, TRANSFORM_OT_translate=None)
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action = 'DESELECT')
-        bpy.ops.object.mode_set(mode='EDIT')
+        # the dynamic topology BMesh only reaches the mesh when leaving sculpt mode
+        if context.sculpt_object.use_dynamic_topology_sculpting:
+            self.report({'WARNING'}, "Turn off dynamic topology first")
+            return {'CANCELLED'}
         
-        # For multires we already have a copy, so lets use that instead of separate.
-        if use_multires == True:
-            bpy.ops.mesh.select_all(action='INVERT')
-            bpy.ops.mesh.delete(type='FACE')
-            bpy.context.scene.objects.active = objCopy;
-        else:
-            try:
-                bpy.ops.mesh.separate(type="SELECTED")
-                bpy.context.scene.objects.active = context.selected_objects[0];
-            except:
-                bpy.ops.object.mode_set(mode='SCULPT')
-                bpy.ops.paint.hide_show(action='SHOW', area='ALL')
-                return {'FINISHED'}
-        bpy.ops.object.mode_set(mode='OBJECT')
+        extracted = extractCached(context, activeObj, isRedo)
+        if extracted is None:
+            return {'FINISHED'}
+        co, loopTotal, loopVerts, smoothFlags, materials = extracted
         
-        # Rename the object for disambiguation
-        bpy.context.scene.objects.active.name = "Extracted." + bpy.context.scene.objects.active.name
-        bpy.ops.object.mode_set(mode='EDIT')
+        mesh = bpy.data.meshes.new("Extracted." + activeObj.data.name)
+        helper.meshFromArrays(mesh, co, loopTotal, loopVerts)
+        mesh.polygons.foreach_set('use_smooth', smoothFlags)
+        mesh.polygons.foreach_set('material_index', materials)
+        for mat in activeObj.data.materials:
+            mesh.materials.append(mat)
         
-        # Solid mode should create a two-sided mesh
-        if wm.extractStyleEnum == 'SOLID':
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.transform.shrink_fatten(value=-wm.extractOffsetFloat) #offset
-            bpy.ops.mesh.region_to_loop()
-            bpy.ops.mesh.select_all(action='INVERT')
-            bpy.ops.mesh.vertices_smooth(repeat = wm.extractSmoothIterationsInt) #smooth everything but border edges to sanitize normals
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.solidify(thickness = -wm.extractDepthFloat)
-            bpy.ops.mesh.select_all(action='SELECT')
-            if wm.extractSmoothIterationsInt>0: bpy.ops.mesh.vertices_smooth(repeat = wm.extractSmoothIterationsInt)
-            bpy.ops.mesh.normals_make_consistent();
-
-        elif wm.extractStyleEnum == 'SINGLE':
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.transform.shrink_fatten(value=-wm.extractOffsetFloat) #offset
-            bpy.ops.mesh.region_to_loop()
-            bpy.ops.mesh.select_all(action='INVERT')
-            bpy.ops.mesh.vertices_smooth(repeat = wm.extractSmoothIterationsInt) #smooth everything but border edges to sanitize normals
-            bpy.ops.mesh.select_all(action='SELECT')
-            # This is to create an extra loop and prevent the bottom vertices running up too far in smoothing
-            # Tried multiple ways to prevent this and this one seemed best
-            bpy.ops.mesh.inset(thickness=0, depth=wm.extractDepthFloat/1000, use_select_inset=False)
-            bpy.ops.mesh.inset(thickness=0, depth=wm.extractDepthFloat-(wm.extractDepthFloat/1000), use_select_inset=False)
-            bpy.ops.mesh.select_all(action='SELECT')
-            bpy.ops.mesh.vertices_smooth(repeat = wm.extractSmoothIterationsInt)
-            bpy.ops.mesh.normals_make_consistent()
-
-        elif wm.extractStyleEnum == 'FLAT':
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.select_all(action='SELECT')
-            # Offset doesn't make much sense for Flat mode, so let's add it to the depth to make it a single op.
-            bpy.ops.transform.shrink_fatten(value=-wm.extractDepthFloat-wm.extractOffsetFloat) 
-            if wm.extractSmoothIterationsInt>0: bpy.ops.mesh.vertices_smooth(repeat = wm.extractSmoothIterationsInt)
-            
-        # clear mask on the extracted mesh
-        bpy.ops.object.mode_set(mode='SCULPT')
-        bpy.ops.paint.mask_flood_fill(mode='VALUE', value=0)
+        extractStyle(mesh, wm)
         
-        bpy.ops.object.mode_set(mode='OBJECT')
+        extractedObj = bpy.data.objects.new("Extracted." + activeObj.name, mesh)
+        extractedObj.matrix_world = activeObj.matrix_world
+        context.scene.objects.link(extractedObj)
         
         # make sure to recreate the odd selection situation for redo
-        if use_multires:
-            bpy.ops.object.select_pattern(pattern=context.active_object.name, case_sensitive=True, extend=False)
-        bpy.context.scene.objects.active = activeObj
+        for obj in context.selected_objects:
+            obj.select = False
+        extractedObj.select = True
         
-        # restore automerge
-        if automerge:
-            bpy.data.scenes[context.scene.name].tool_settings.use_mesh_automerge = True
-
-        # restore mode for original object
-        bpy.ops.object.mode_set(mode='SCULPT')
-        return {'FINISHED'}
\ No newline at end of file
+        return {'FINISHED'}
@@ -0,0 +1,132 @@
+import bpy
+import os
+import json
+import time
+import collections
+import contextlib
+import functools
+from . import helper
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+# runs kept for the panel readout
+recentRuns = collections.deque(maxlen = 5)
+# the log is rotated once it grows past this many bytes, one old log is kept
+logSize = 1 << 20
+
+# the run being recorded, only the outermost operator records so nested operator calls fold into their caller
+current = None
+
+def logPath():
+    return os.path.join(bpy.utils.user_resource('CONFIG', path='sculpt_tools', create=True), "profile.jsonl")
+
+def logRun(run):
+    path = logPath()
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > logSize:
+            os.replace(path, path+".1")
+        with open(path, 'a') as f:
+            f.write(json.dumps(run, sort_keys=True)+"\n")
+    except (IOError, OSError):
+        pass
+
+# resident memory of the process right now in MB, only known on linux
+def currentMemory():
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024.0*1024.0)
+
+# peak resident memory over the whole life of the process in MB, it never goes down
+def peakMemory():
+    if resource is None:
+        return None
+    # kilobytes on linux, bytes on mac
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0*1024.0 if os.uname()[0] == 'Darwin' else 1024.0)
+
+# vertex and face counts of the meshes the operator works on
+def meshCounts(context):
+    objects = set(context.selected_objects)
+    if context.active_object is not None:
+        objects.add(context.active_object)
+    meshes = [obj.data for obj in objects if obj.type == 'MESH']
+    return {"vertices": sum(len(mesh.vertices) for mesh in meshes), "faces": sum(len(mesh.polygons) for mesh in meshes)}
+
+# times a named part of an operator, repeated stages add up. Works as a decorator too
+@contextlib.contextmanager
+def stage(name):
+    if current is None:
+        yield
+        return
+    startTime = time.time()
+    try:
+        yield
+    finally:
+        stages = current["stages"]
+        stages[name] = stages.get(name, 0.0) + time.time()-startTime
+
+def profiled(op, context, execute):
+    global current
+    counters = dict(helper.counters)
+    memory = currentMemory()
+    peak = peakMemory()
+    current = {"operator": op.bl_idname, "time": time.strftime("%Y-%m-%d %H:%M:%S"), "stages": {}, "input": meshCounts(context)}
+    startTime = time.time()
+    try:
+        result = execute(op, context)
+    finally:
+        run = current
+        current = None
+        run["seconds"] = time.time()-startTime
+        for key in ("mode_set", "mode_set_elided", "modifier_apply", "to_mesh", "boolean_skipped", "boolean_localized"):
+            run[key] = helper.counters[key] - counters.get(key, 0)
+        run["output"] = meshCounts(context)
+        # what the run kept and whether it pushed the process peak up, the peak alone says nothing after
+        # the first heavy run
+        after = currentMemory()
+        run["memoryDelta"] = after - memory if memory is not None and after is not None else None
+        run["processPeakMemory"] = peakMemory()
+        run["peakGrowth"] = run["processPeakMemory"] - peak if peak is not None else None
+        recentRuns.append(run)
+        logRun(run)
+    return result
+
+# wraps the operator's execute so it is profiled while profiling is switched on in the panel
+def instrument(cls):
+    execute = cls.__dict__.get('execute')
+    if execute is None or getattr(execute, 'instrumented', False):
+        return cls
+
+    @functools.wraps(execute)
+    def wrapped(self, context):
+        if current is not None or not context.window_manager.profileOperators:
+            return execute(self, context)
+        return profiled(self, context, execute)
+
+    wrapped.instrumented = True
+    cls.execute = wrapped
+    return cls
+
+def instrumentModule(module):
+    for cls in list(vars(module).values()):
+        if isinstance(cls, type) and issubclass(cls, bpy.types.Operator) and cls.__module__ == module.__name__:
+            instrument(cls)
+
+def drawRuns(layout):
+    if not recentRuns:
+        layout.label(text="No runs recorded")
+    for run in reversed(recentRuns):
+        layout.label(text="%s  %.3fs" % (run["operator"], run["seconds"]))
+        for name, seconds in sorted(run["stages"].items(), key=lambda item: -item[1]):
+            layout.label(text="    %s  %.3fs" % (name, seconds))
+        layout.label(text="    %d mode sets (%d skipped), %d applies, %d -> %d faces" % (run["mode_set"], run["mode_set_elided"],
+                     run["modifier_apply"], run["input"]["faces"], run["output"]["faces"]))
+        if run["memoryDelta"] is not None:
+            layout.label(text="    memory %+.0f MB, process peak %+.0f MB" % (run["memoryDelta"], run["peakGrowth"] or 0.0))
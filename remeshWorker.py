@@ -0,0 +1,75 @@
+# Headless remesh worker, started by the background Remesh operator as
+#   blender -b --factory-startup --python remeshWorker.py -- <job dir> <depth> <subdivisions> <scale> <preserve shape>
+# Reads input.npz from the job dir, writes output.npz there and keeps progress.txt up to date
+# with the share of the stages done and the stage that is running.
+import bpy
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import helper
+
+def progress(jobDir, stages, stage):
+    path = os.path.join(jobDir, 'progress.txt')
+    with open(path + '.tmp', 'w') as f:
+        f.write("%.2f %s" % (float(stages.index(stage)) / len(stages), stage))
+    os.replace(path + '.tmp', path)
+
+# the mesh with a single modifier on it, evaluated into a new mesh
+def evaluate(mesh, kind, **settings):
+    scene = bpy.context.scene
+    ob = bpy.data.objects.new("Remesh" + kind.title(), mesh)
+    scene.objects.link(ob)
+    md = ob.modifiers.new(kind.lower(), kind)
+    for name, value in settings.items():
+        setattr(md, name, value)
+    result = ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=False)
+    scene.objects.unlink(ob)
+    bpy.data.objects.remove(ob)
+    return result
+
+def main():
+    args = sys.argv[sys.argv.index('--')+1:]
+    jobDir = args[0]
+    depth = int(args[1])
+    subdivisions = int(args[2])
+    scale = float(args[3])
+    preserveShape = len(args) > 4 and args[4] == '1'
+    stages = ["loading", "remeshing"] + (["subdividing"] if subdivisions > 0 else []) + \
+             (["preserving shape"] if preserveShape else []) + ["writing"]
+    
+    startTime = time.time()
+    progress(jobDir, stages, "loading")
+    data = np.load(os.path.join(jobDir, 'input.npz'))
+    source = bpy.data.meshes.new("RemeshInput")
+    helper.meshFromArrays(source, data['co'], data['loopTotal'], data['loopVerts'])
+    
+    progress(jobDir, stages, "remeshing")
+    mesh = evaluate(source, 'REMESH', mode='SMOOTH', octree_depth=depth, scale=scale, use_remove_disconnected=False)
+    
+    if subdivisions > 0:
+        progress(jobDir, stages, "subdividing")
+        subdivided = evaluate(mesh, 'SUBSURF', levels=subdivisions)
+        bpy.data.meshes.remove(mesh)
+        mesh = subdivided
+    
+    if preserveShape:
+        progress(jobDir, stages, "preserving shape")
+        target = bpy.data.objects.new("RemeshTarget", source)
+        bpy.context.scene.objects.link(target)
+        projected = evaluate(mesh, 'SHRINKWRAP', wrap_method='PROJECT', use_negative_direction=True,
+                             use_positive_direction=True, target=target)
+        bpy.data.meshes.remove(mesh)
+        mesh = projected
+    
+    progress(jobDir, stages, "writing")
+    co, loopTotal, loopVerts = helper.meshToArrays(mesh)
+    # write under a temporary name so the operator never picks up a half written file
+    path = os.path.join(jobDir, 'output.npz')
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, co=co, loopTotal=loopTotal, loopVerts=loopVerts, seconds=time.time()-startTime)
+    os.replace(path + '.tmp', path)
+
+main()
@@ -0,0 +1,129 @@
+import bpy
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# vertices per chunk when smoothing on the thread pool
+chunkSize = 65536
+
+# symmetric vertex adjacency in CSR form, built from the (m, 2) edge array
+def adjacency(vertCount, edges):
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    indices = cols[np.argsort(rows, kind='mergesort')]
+    indptr = np.zeros(vertCount+1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=vertCount), out=indptr[1:])
+    return indptr, indices
+
+# vertices on edges used by a single face
+def borderVerts(mesh, edges):
+    loopEdges = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('edge_index', loopEdges)
+    border = np.zeros(len(mesh.vertices), dtype=bool)
+    border[edges[np.bincount(loopEdges, minlength=len(edges)) == 1].ravel()] = True
+    return border
+
+# per chunk data that stays the same across iterations
+def makeChunks(indptr, indices, pinned):
+    vertCount = len(indptr)-1
+    chunks = []
+    for start in range(0, vertCount, chunkSize):
+        stop = min(start+chunkSize, vertCount)
+        degree = np.diff(indptr[start:stop+1])
+        rows = np.repeat(np.arange(stop-start), degree)
+        free = degree > 0
+        if pinned is not None:
+            free &= ~pinned[start:stop]
+        chunks.append((start, stop, rows, indices[indptr[start]:indptr[stop]], degree, np.flatnonzero(free)))
+    return chunks
+
+def smoothChunk(co, out, chunk, factor):
+    start, stop, rows, cols, degree, free = chunk
+    neighbours = co[cols]
+    average = np.empty((stop-start, 3), dtype=co.dtype)
+    for axis in range(3):
+        average[:, axis] = np.bincount(rows, weights=neighbours[:, axis], minlength=stop-start)
+    average[free] /= degree[free, None]
+
+    result = co[start:stop].copy()
+    # same as bmesh smooth_vert, which moves towards the average of the edge midpoints
+    result[free] += (0.5*factor) * (average[free] - result[free])
+    out[start:stop] = result
+
+# Laplacian smoothing of an (n, 3) array, pinned vertices don't move
+def smoothArray(co, edges, iterations, factor = 0.5, pinned = None):
+    if iterations <= 0 or len(edges) == 0:
+        return co
+    indptr, indices = adjacency(len(co), edges)
+    chunks = makeChunks(indptr, indices, pinned)
+
+    co = co.astype(np.float64)
+    out = np.empty_like(co)
+
+    # numpy releases the GIL for the heavy parts, so chunks run in parallel on large meshes
+    pool = ThreadPoolExecutor(os.cpu_count() or 1) if len(chunks) > 1 else None
+    for i in range(iterations):
+        if pool is None:
+            smoothChunk(co, out, chunks[0], factor)
+        else:
+            list(pool.map(lambda chunk: smoothChunk(co, out, chunk, factor), chunks))
+        co, out = out, co
+    if pool is not None:
+        pool.shutdown()
+    return co
+
+def meshSmooth(mesh, iterations, factor = 0.5, pinBorder = False):
+    if iterations <= 0:
+        return
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    edges = np.empty(len(mesh.edges)*2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    edges = edges.reshape(-1, 2)
+
+    pinned = borderVerts(mesh, edges) if pinBorder else None
+    co = smoothArray(co.reshape(-1, 3), edges, iterations, factor, pinned)
+
+    mesh.vertices.foreach_set('co', co.astype(np.float32).ravel())
+    mesh.update()
+
+# times the kernel against the vertices_smooth operator loop on copies of the object's mesh
+def benchmark(ob, iterations):
+    scene = bpy.context.scene
+    timings = {}
+
+    mesh = ob.data.copy()
+    startTime = time.time()
+    meshSmooth(mesh, iterations)
+    timings["kernel"] = time.time()-startTime
+    bpy.data.meshes.remove(mesh)
+
+    obCopy = ob.copy()
+    obCopy.data = ob.data.copy()
+    scene.objects.link(obCopy)
+    activeObj = scene.objects.active
+    scene.objects.active = obCopy
+    startTime = time.time()
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='SELECT')
+    bpy.ops.mesh.vertices_smooth(repeat = iterations)
+    bpy.ops.object.mode_set(mode='OBJECT')
+    timings["operator"] = time.time()-startTime
+    scene.objects.active = activeObj
+    mesh = obCopy.data
+    scene.objects.unlink(obCopy)
+    bpy.data.objects.remove(obCopy)
+    bpy.data.meshes.remove(mesh)
+
+    return timings
+
+# blender -b --python smooth.py
+if __name__ == "__main__":
+    for subdivisions in (5, 6, 7, 8):
+        bpy.ops.mesh.primitive_ico_sphere_add(subdivisions = subdivisions)
+        ob = bpy.context.active_object
+        for iterations in (5, 50):
+            timings = benchmark(ob, iterations)
+            print("%8d faces, %2d iterations: kernel %.3fs, operator %.3fs (%.1fx)" % (len(ob.data.polygons), iterations,
+                  timings["kernel"], timings["operator"], timings["operator"]/max(timings["kernel"], 1e-9)))
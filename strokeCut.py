@@ -0,0 +1,255 @@
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Vector
+from . import helper, profiling
+
+# which 2D points fall inside the closed polygon, even-odd rule.
+# The points are sorted by y once, so every polygon edge only tests the slab of points within its y range
+def pointsInPolygon(points, polygon):
+    inside = np.zeros(len(points), dtype=bool)
+    order = np.argsort(points[:, 1], kind='mergesort')
+    ys = points[order, 1]
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if y0 == y1:
+            continue
+        lo, hi = min(y0, y1), max(y0, y1)
+        slab = order[np.searchsorted(ys, lo):np.searchsorted(ys, hi)]
+        if len(slab) == 0:
+            continue
+        px = points[slab, 0]
+        py = points[slab, 1]
+        crossing = x0 + (py-y0)*(x1-x0)/(y1-y0)
+        inside[slab[px < crossing]] ^= True
+    return inside
+
+# bit s of a label is set when the point is inside stroke s
+def strokeLabels(points, strokes):
+    labels = np.zeros(len(points), dtype=np.int32)
+    for s, stroke in enumerate(strokes):
+        labels[pointsInPolygon(points, stroke)] |= 1 << s
+    return labels
+
+# vertices of a polyline given as unordered edges, in walking order
+def edgeLoopOrder(edges):
+    neighbours = {}
+    for a, b in edges:
+        neighbours.setdefault(a, []).append(b)
+        neighbours.setdefault(b, []).append(a)
+    if not neighbours:
+        return []
+    # start at an open end if there is one
+    start = next((v for v, n in neighbours.items() if len(n) == 1), next(iter(neighbours)))
+    order = [start]
+    visited = {start}
+    while True:
+        step = [n for n in neighbours[order[-1]] if n not in visited]
+        if not step:
+            return order
+        order.append(step[0])
+        visited.add(step[0])
+
+# uniform 2D grid of face bounding boxes, so a stroke segment only looks at the faces around it
+class FaceGrid:
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        self.cells = {}
+        self.bounds = {}
+
+    def cellRange(self, lo, hi):
+        x0, y0 = (np.floor(np.asarray(lo) / self.cellSize)).astype(int)
+        x1, y1 = (np.floor(np.asarray(hi) / self.cellSize)).astype(int)
+        return [(x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+    def add(self, face, lo, hi):
+        self.bounds[face] = (lo, hi)
+        for cell in self.cellRange(lo, hi):
+            self.cells.setdefault(cell, []).append(face)
+
+    def query(self, lo, hi):
+        found = set()
+        for cell in self.cellRange(lo, hi):
+            for face in self.cells.get(cell, ()):
+                flo, fhi = self.bounds[face]
+                if flo[0] <= hi[0] and lo[0] <= fhi[0] and flo[1] <= hi[1] and lo[1] <= fhi[1]:
+                    found.add(face)
+        return found
+
+# Splits the object's mesh along the strokes (closed polygons of world space points) as seen through
+# viewMatrix, without a boolean solver. Faces are classified by which strokes contain them in view space
+# and only the faces straddling a stroke are cut. Returns one piece per combination of strokes, as
+# (label, co, loopTotal, loopVerts, smooth, materials, seamVerts, layers, mask, uvSeams), where label bit s is set
+# inside stroke s. The loop layers, sculpt mask and UV seams are interpolated through the cut by bmesh.
+@profiling.stage("partition")
+def strokePartition(ob, strokes, viewMatrix):
+    mesh = ob.data
+    co, loopTotal, loopVerts = helper.meshToArrays(mesh)
+    if len(loopTotal) == 0:
+        return []
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+
+    # object space to view space, the view axis is dropped to project
+    toView = viewMatrix * ob.matrix_world
+    matrix = np.array(toView)
+    viewCo = co.dot(matrix[:3, :3].T) + matrix[:3, 3]
+    view = np.array(viewMatrix)
+    strokes2d = [(np.asarray(stroke).dot(view[:3, :3].T) + view[:3, 3])[:, :2] for stroke in strokes]
+
+    vertLabels = strokeLabels(viewCo[:, :2], strokes2d)
+    faceMin = np.minimum.reduceat(vertLabels[loopVerts], loopStart)
+    faceMax = np.maximum.reduceat(vertLabels[loopVerts], loopStart)
+    straddle = np.flatnonzero(faceMin != faceMax)
+    faceLabels = np.where(faceMin == faceMax, faceMin, -1).astype(np.int32)
+
+    # the labels ride along with the faces through the cut as a face layer, split faces inherit it.
+    # The layer goes on a throwaway copy so the object's mesh is never touched
+    labelMesh = mesh.copy()
+    layer = labelMesh.polygon_layers_int.new(name="strokeCutLabel")
+    layer.data.foreach_set('value', faceLabels)
+    bm = bmesh.new()
+    bm.from_mesh(labelMesh)
+    bpy.data.meshes.remove(labelMesh)
+    labelLayer = bm.faces.layers.int["strokeCutLabel"]
+
+    if len(straddle):
+        bm.faces.ensure_lookup_table()
+        fromView = toView.inverted()
+
+        def viewPoints(face):
+            return np.array([(toView * v.co)[:2] for v in face.verts])
+
+        def viewBounds(face):
+            points = viewPoints(face)
+            return points.min(axis=0), points.max(axis=0)
+
+        # whether the line through the segment crosses the face within the segment, the plane cut would
+        # otherwise split faces far along the line
+        def segmentCuts(face, p, q):
+            points = viewPoints(face)
+            d = q - p
+            side = (points - p).dot((-d[1], d[0]))
+            following = np.roll(side, -1)
+            crossing = (side * following <= 0.0) & (side != following)
+            if not crossing.any():
+                return False
+            start = points[crossing]
+            end = np.roll(points, -1, axis=0)[crossing]
+            x = start + (end - start) * (side[crossing] / (side[crossing] - following[crossing]))[:, None]
+            t = (x - p).dot(d) / d.dot(d)
+            return t.max() >= 0.0 and t.min() <= 1.0
+
+        faceViewCo = viewCo[:, :2][loopVerts]
+        lo = np.column_stack([np.minimum.reduceat(faceViewCo[:, i], loopStart)[straddle] for i in (0, 1)])
+        hi = np.column_stack([np.maximum.reduceat(faceViewCo[:, i], loopStart)[straddle] for i in (0, 1)])
+        grid = FaceGrid(max(float(np.median(hi-lo))*4.0, 1e-6))
+        for i, face in enumerate(straddle):
+            grid.add(bm.faces[face], lo[i], hi[i])
+
+        for stroke in strokes2d:
+            for p, q in zip(stroke, np.roll(stroke, -1, axis=0)):
+                if np.allclose(p, q):
+                    continue
+                candidates = [face for face in grid.query(np.minimum(p, q), np.maximum(p, q)) if segmentCuts(face, p, q)]
+                if not candidates:
+                    continue
+                # plane through the segment, containing the view axis
+                normal = fromView.to_3x3().transposed().inverted() * Vector((q[1]-p[1], p[0]-q[0], 0.0))
+                point = fromView * Vector((p[0], p[1], 0.0))
+                geom = set(candidates)
+                for face in candidates:
+                    geom.update(face.edges)
+                    geom.update(face.verts)
+                result = bmesh.ops.bisect_plane(bm, geom=list(geom), dist=1e-6, plane_co=point, plane_no=normal.normalized())
+                for elem in result['geom']:
+                    if isinstance(elem, bmesh.types.BMFace) and elem not in grid.bounds:
+                        flo, fhi = viewBounds(elem)
+                        grid.add(elem, flo, fhi)
+
+        # everything that was touched is classified by its center
+        band = list(grid.bounds)
+        centers = np.array([(toView * face.calc_center_median())[:2] for face in band])
+        for face, label in zip(band, strokeLabels(centers, strokes2d)):
+            face[labelLayer] = int(label)
+
+    cutMesh = bpy.data.meshes.new("StrokeCut")
+    bm.to_mesh(cutMesh)
+    bm.free()
+
+    co, loopTotal, loopVerts = helper.meshToArrays(cutMesh)
+    faceLabels = np.empty(len(loopTotal), dtype=np.int32)
+    cutMesh.polygon_layers_int["strokeCutLabel"].data.foreach_get('value', faceLabels)
+    smooth = np.empty(len(loopTotal), dtype=np.int32)
+    cutMesh.polygons.foreach_get('use_smooth', smooth)
+    materials = np.empty(len(loopTotal), dtype=np.int32)
+    cutMesh.polygons.foreach_get('material_index', materials)
+    layers = helper.meshLoopLayers(cutMesh)
+    mask = helper.meshMask(cutMesh)
+    useSeam = np.empty(len(cutMesh.edges), dtype=np.int32)
+    cutMesh.edges.foreach_get('use_seam', useSeam)
+
+    # seam vertices sit on edges whose faces ended up in different pieces
+    edges = np.empty(len(cutMesh.edges)*2, dtype=np.int32)
+    cutMesh.edges.foreach_get('vertices', edges)
+    loopEdges = np.empty(len(cutMesh.loops), dtype=np.int32)
+    cutMesh.loops.foreach_get('edge_index', loopEdges)
+    bpy.data.meshes.remove(cutMesh)
+
+    loopLabels = np.repeat(faceLabels, loopTotal)
+    edgeMin = np.full(len(edges)//2, np.iinfo(np.int32).max, dtype=np.int32)
+    edgeMax = np.full(len(edges)//2, -1, dtype=np.int32)
+    np.minimum.at(edgeMin, loopEdges, loopLabels)
+    np.maximum.at(edgeMax, loopEdges, loopLabels)
+    seam = np.zeros(len(co), dtype=bool)
+    seam[edges.reshape(-1, 2)[(edgeMin != edgeMax) & (edgeMax >= 0)].ravel()] = True
+    uvSeamEdges = edges.reshape(-1, 2)[useSeam.astype(bool)]
+
+    pieces = []
+    for label in np.unique(faceLabels):
+        faceMask = faceLabels == label
+        loopMask = np.repeat(faceMask, loopTotal)
+        pieceCo, pieceTotal, pieceVerts, used = helper.meshSubset(co, loopTotal, loopVerts, faceMask)
+        # UV seams as vertex pairs of the piece, the edges themselves are rebuilt when it is written
+        remap = np.full(len(co), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        uvSeams = remap[uvSeamEdges]
+        pieces.append((int(label), pieceCo, pieceTotal, pieceVerts, smooth[faceMask], materials[faceMask], seam[used],
+                       [(kind, name, data[loopMask]) for kind, name, data in layers],
+                       mask[used] if mask is not None else None, uvSeams[(uvSeams >= 0).all(axis=1)]))
+    return pieces
+
+# writes a piece into the mesh, optionally closing the openings the cut left behind
+def pieceToMesh(mesh, piece, fill):
+    label, co, loopTotal, loopVerts, smooth, materials, seamVerts, layers, mask, uvSeams = piece
+    helper.meshFromArrays(mesh, co, loopTotal, loopVerts)
+    mesh.polygons.foreach_set('use_smooth', smooth)
+    mesh.polygons.foreach_set('material_index', materials)
+    helper.meshSetLoopLayers(mesh, layers)
+
+    edges = np.empty(len(mesh.edges)*2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    edges = edges.reshape(-1, 2)
+    if len(uvSeams):
+        def edgeKeys(pairs):
+            return np.sort(pairs, axis=1).astype(np.int64).dot((len(co), 1))
+        mesh.edges.foreach_set('use_seam', np.in1d(edgeKeys(edges), edgeKeys(uvSeams)).astype(np.int32))
+
+    openSeam = []
+    if fill and seamVerts.any():
+        loopEdges = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('edge_index', loopEdges)
+        openSeam = np.flatnonzero((np.bincount(loopEdges, minlength=len(edges)) == 1) & seamVerts[edges].all(axis=1))
+    if not len(openSeam) and mask is None:
+        return
+
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    if mask is not None:
+        maskLayer = bm.verts.layers.paint_mask.verify()
+        for v, value in zip(bm.verts, mask.tolist()):
+            v[maskLayer] = value
+    if len(openSeam):
+        bm.edges.ensure_lookup_table()
+        bmesh.ops.holes_fill(bm, edges=[bm.edges[i] for i in openSeam], sides=0)
+    bm.to_mesh(mesh)
+    bm.free()
@@ -1,5 +1,118 @@
 import bpy
-from . import helper
+import os
+import json
+import collections
+import math
+import time
+import shutil
+import tempfile
+import subprocess
+import bmesh
+import numpy as np
+from mathutils import Matrix, Vector
+from . import helper, profiling, Freeze
+
+# grid scale of the remesh modifier
+remeshScale = 0.99
+
+# calibrated on past runs: output faces per (area / cell size squared), and seconds per output face
+remeshModel = {"faces": 1.5, "seconds": 2e-6, "loaded": False}
+
+# cached (largest dimension, surface area) of the meshes the panel asks about
+remeshMeasures = {}
+
+def remeshModelPath():
+    return os.path.join(bpy.utils.user_resource('CONFIG', path='sculpt_tools', create=True), 'remesh_model.json')
+
+def remeshModelLoad():
+    if remeshModel["loaded"]:
+        return
+    remeshModel["loaded"] = True
+    try:
+        with open(remeshModelPath()) as f:
+            stored = json.load(f)
+        remeshModel["faces"] = float(stored["faces"])
+        remeshModel["seconds"] = float(stored["seconds"])
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+
+# blend a finished run into the model
+def remeshModelUpdate(measure, depth, subdivisions, faces, seconds):
+    largest, area = measure
+    if faces == 0 or area == 0:
+        return
+    cell = remeshCellSize(largest, depth)
+    remeshModel["faces"] = 0.7*remeshModel["faces"] + 0.3*faces*cell*cell/(area*4**subdivisions)
+    remeshModel["seconds"] = 0.7*remeshModel["seconds"] + 0.3*seconds/faces
+    try:
+        with open(remeshModelPath(), 'w') as f:
+            json.dump({"faces": remeshModel["faces"], "seconds": remeshModel["seconds"]}, f)
+    except (IOError, OSError):
+        pass
+
+# largest dimension and surface area of the object in object space, the space the remesh grid lives in
+def remeshMeasure(ob, cached = True):
+    mesh = ob.data
+    key = (mesh.name, len(mesh.vertices), len(mesh.polygons))
+    if not cached or key not in remeshMeasures:
+        corners = [corner[:] for corner in ob.bound_box]
+        largest = max(max(c[i] for c in corners) - min(c[i] for c in corners) for i in range(3))
+        remeshMeasures.clear()
+        remeshMeasures[key] = (largest, helper.meshArea(mesh))
+    return remeshMeasures[key]
+
+def remeshCellSize(largest, depth):
+    return largest / (remeshScale * 2**depth)
+
+# predicted output faces and seconds
+def remeshPredict(ob, depth, subdivisions):
+    remeshModelLoad()
+    largest, area = remeshMeasure(ob)
+    if largest == 0:
+        return 0, 0.0
+    cell = remeshCellSize(largest, depth)
+    faces = int(remeshModel["faces"] * area / (cell*cell) * 4**subdivisions)
+    return faces, faces * remeshModel["seconds"]
+
+# octree depth and subdivision levels for the remesh mode chosen in the panel
+def remeshSettings(ob, wm):
+    if wm.remeshModeEnum == 'FACES':
+        # subdivisions multiply the faces as much as a depth level does but add no detail, use them only past depth 10
+        best = None
+        for subdivisions in range(0, 7):
+            for depth in range(2, 11):
+                faces = remeshPredict(ob, depth, subdivisions)[0]
+                error = abs(math.log(max(faces, 1) / float(wm.remeshTargetFaces)))
+                if best is None or error < best[0] - 1e-6:
+                    best = (error, depth, subdivisions)
+        return best[1], best[2]
+        
+    elif wm.remeshModeEnum == 'DETAIL':
+        largest = remeshMeasure(ob)[0]
+        # the detail size is given in world space
+        scale = abs(ob.matrix_world.determinant())**(1.0/3.0) or 1.0
+        detail = wm.remeshDetailSize / scale
+        depth = int(math.ceil(math.log(max(largest / (remeshScale*detail), 1.0), 2)))
+        subdivisions = min(max(depth-10, 0), 6)
+        return min(max(depth, 2), 10), subdivisions
+        
+    return wm.remeshDepthInt, wm.remeshSubdivisions
+
+def remeshDrawSettings(layout, ob, wm):
+    layout.prop(wm, "remeshModeEnum", text="")
+    row = layout.row(align=True)
+    if wm.remeshModeEnum == 'FACES':
+        row.prop(wm, "remeshTargetFaces", text="Faces")
+    elif wm.remeshModeEnum == 'DETAIL':
+        row.prop(wm, "remeshDetailSize", text="Detail Size")
+    else:
+        row.prop(wm, "remeshDepthInt", text="Depth")
+        row.prop(wm, "remeshSubdivisions", text="Subdivisions")
+    
+    if ob is not None and ob.type == 'MESH':
+        depth, subdivisions = remeshSettings(ob, wm)
+        faces, seconds = remeshPredict(ob, depth, subdivisions)
+        layout.label(text="Depth %d, Subd %d: ~%dk faces, ~%.1fs" % (depth, subdivisions, faces//1000, seconds))
 
 class BooleanMeshDeformOperator(bpy.types.Operator):
     '''Binds a deforming mesh to the object'''
@@ -18,11 +131,80 @@ class BooleanMeshDeformOperator(bpy.types.Operator):
                 md = activeObj.modifiers.new('mesh_deform', 'MESH_DEFORM')
                 md.object = SelectedObject
                 bpy.ops.object.meshdeform_bind(modifier="mesh_deform")
-                bpy.context.scene.objects.active = SelectedObject
+                helper.setActive(SelectedObject)
                 SelectedObject.draw_type="WIRE"
-                bpy.ops.object.mode_set(mode='EDIT')
+                helper.modeSet('EDIT')
         return {'FINISHED'}
     
+# modifiers that only look at the mesh itself, a stack of these gives the same result on every linked duplicate
+localModifiers = {'SUBSURF', 'MULTIRES', 'MIRROR', 'SOLIDIFY', 'DECIMATE', 'REMESH', 'TRIANGULATE', 'BEVEL', 'EDGE_SPLIT',
+                  'SMOOTH', 'LAPLACIANSMOOTH', 'WIREFRAME', 'SKIN', 'SCREW', 'ARRAY', 'MASK'}
+# properties that don't change the result
+uiProperties = {'rna_type', 'name', 'show_expanded', 'show_on_cage', 'show_in_editmode', 'show_render'}
+
+# modifiers the evaluation skips because they lack their target, modifier_apply refuses these too
+def modifierDisabled(md):
+    if md.type == 'MESH_DEFORM':
+        return md.object is None or not md.is_bound
+    target = {'BOOLEAN': 'object', 'SHRINKWRAP': 'target', 'ARMATURE': 'object', 'CURVE': 'object',
+              'LATTICE': 'object', 'HOOK': 'object'}.get(md.type)
+    return target is not None and getattr(md, target) is None
+
+# objects with the same key evaluate to the same mesh, None if the stack depends on the object itself
+def stackKey(ob):
+    key = [ob.data, tuple(group.name for group in ob.vertex_groups)]
+    for md in ob.modifiers:
+        if md.type not in localModifiers:
+            return None
+        for prop in md.bl_rna.properties:
+            if prop.identifier in uiProperties or prop.type == 'COLLECTION':
+                continue
+            value = getattr(md, prop.identifier)
+            if prop.type == 'POINTER':
+                # mirror objects, array offsets and the like make the result depend on the object's transform
+                if value is not None:
+                    return None
+                continue
+            if hasattr(value, '__len__') and not isinstance(value, str):
+                value = tuple(value)
+            key.append((prop.identifier, value))
+    return tuple(key)
+
+# the object's whole stack evaluated once, None if it has to go modifier by modifier
+def stackEvaluate(scene, ob):
+    if ob.type != 'MESH' or ob.data.shape_keys is not None:
+        # shape keys would be flattened into the active shape
+        return None
+    if any(modifierDisabled(md) for md in ob.modifiers if md.show_viewport):
+        return None
+    helper.counters['to_mesh'] += 1
+    try:
+        return ob.to_mesh(scene, True, 'PREVIEW', calc_tessface=False)
+    except RuntimeError:
+        return None
+
+# puts the evaluated mesh in place and drops the modifiers that went into it
+def stackAssign(ob, mesh):
+    oldMesh = ob.data
+    ob.data = mesh
+    # modifiers hidden in the viewport weren't evaluated, applying them fails as well so they stay
+    for md in [md for md in ob.modifiers if md.show_viewport]:
+        ob.modifiers.remove(md)
+    if oldMesh.users == 0:
+        name = oldMesh.name
+        bpy.data.meshes.remove(oldMesh)
+        mesh.name = name
+
+def stackApplyEach(ob):
+    helper.setActive(ob)
+    helper.modeSet('OBJECT')
+    for name in [md.name for md in ob.modifiers]:
+        # apply the modifier
+        try:
+            helper.modifierApply(name)
+        except:
+            pass
+
 class ModApplyOperator(bpy.types.Operator):
     '''Applies all modifiers for all selected objects. Also works in sculpt or edit mode.'''
     bl_idname = "boolean.mod_apply"
@@ -34,20 +216,32 @@ class ModApplyOperator(bpy.types.Operator):
         return context.active_object is not None
 
     def execute(self, context):
-        activeObj = context.active_object
+        # linked duplicates with the same stack share one evaluation
+        stacks = collections.OrderedDict()
         for SelectedObject in bpy.context.selected_objects :
-               
-            bpy.context.scene.objects.active = SelectedObject
-            oldMode = SelectedObject.mode    
-            bpy.ops.object.mode_set(mode='OBJECT')
-            for md in SelectedObject.modifiers :
-                # apply the modifier
-                try:
-                    bpy.ops.object.modifier_apply(apply_as='DATA', modifier=md.name)
-                except:
-                    pass
-            bpy.ops.object.mode_set(mode=oldMode)
-        bpy.context.scene.objects.active = activeObj
+            if len(SelectedObject.modifiers) > 0:
+                key = stackKey(SelectedObject) if SelectedObject.type == 'MESH' else None
+                stacks.setdefault(SelectedObject if key is None else key, []).append(SelectedObject)
+        
+        # the active object and its mode are restored once at the end
+        evaluations = 0
+        with helper.ModeState():
+            if any(context.active_object in objects for objects in stacks.values()):
+                helper.modeSet('OBJECT')
+                helper.modeFlush()
+            
+            for objects in stacks.values():
+                mesh = stackEvaluate(context.scene, objects[0])
+                if mesh is None:
+                    for SelectedObject in objects:
+                        stackApplyEach(SelectedObject)
+                    continue
+                evaluations += 1
+                for SelectedObject in objects:
+                    stackAssign(SelectedObject, mesh)
+        
+        if evaluations > 0:
+            self.report({'INFO'}, "%d objects, %d stack evaluations" % (sum(len(objects) for objects in stacks.values()), evaluations))
         return {'FINISHED'}
     
 class RemeshOperator(bpy.types.Operator):
@@ -64,8 +258,7 @@ class RemeshOperator(bpy.types.Operator):
         if context.active_object.mode != 'SCULPT':   
             wm = context.window_manager
             layout = self.layout
-            layout.prop(wm, "remeshDepthInt", text="Depth")
-            layout.prop(wm, "remeshSubdivisions", text="Subdivisions")
+            remeshDrawSettings(layout, context.active_object, wm)
             layout.prop(wm, "remeshPreserveShape", text="Preserve Shape")
         
     def execute(self, context):
@@ -80,38 +273,44 @@ class RemeshOperator(bpy.types.Operator):
                 dyntopoOn = True
                 bpy.ops.sculpt.dynamic_topology_toggle()
         
-        bpy.ops.object.mode_set(mode='OBJECT')
+        helper.modeSet('OBJECT')
         
-        if wm.remeshPreserveShape:            
-            obCopy = helper.objDuplicate(ob)
+        depth, subdivisions = remeshSettings(ob, wm)
+        measure = remeshMeasure(ob, False)
+        startTime = time.time()
         
         md = ob.modifiers.new('sculptremesh', 'REMESH')
         md.mode = 'SMOOTH'
-        md.octree_depth = wm.remeshDepthInt
+        md.octree_depth = depth
         md.scale = .99
         md.use_remove_disconnected = False
-
-        # apply the modifier
-        bpy.ops.object.modifier_apply(apply_as='DATA', modifier="sculptremesh")
-        
-        if wm.remeshSubdivisions > 0:
-            mdsub = ob.modifiers.new('RemeshSubSurf', 'SUBSURF')
-            mdsub.levels = wm.remeshSubdivisions
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier="RemeshSubSurf")
-        
         
-        if wm.remeshPreserveShape:            
-            md2 = ob.modifiers.new('RemeshShrinkwrap', 'SHRINKWRAP')
-            md2.wrap_method = 'PROJECT'
-            md2.use_negative_direction = True
-            md2.use_positive_direction = True
-            md2.target = obCopy
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier="RemeshShrinkwrap")
+        if wm.remeshPreserveShape:
+            # the result is evaluated next to the old surface, which stays the object's mesh until it
+            # has been projected onto
+            names = ['sculptremesh']
+            if subdivisions > 0:
+                mdsub = ob.modifiers.new('RemeshSubSurf', 'SUBSURF')
+                mdsub.levels = subdivisions
+                names.append('RemeshSubSurf')
+            with profiling.stage("remesh"):
+                remeshed = helper.objEvaluate(ob, names)
+            with profiling.stage("preserve shape"):
+                helper.objProject(ob, remeshed)
+        else:
+            # apply the modifier
+            with profiling.stage("remesh"):
+                helper.modifierApply("sculptremesh")
             
-            bpy.data.scenes[0].objects.unlink(obCopy)
-            bpy.data.objects.remove(obCopy)
+            if subdivisions > 0:
+                mdsub = ob.modifiers.new('RemeshSubSurf', 'SUBSURF')
+                mdsub.levels = subdivisions
+                with profiling.stage("subdivide"):
+                    helper.modifierApply("RemeshSubSurf")
         
-        bpy.ops.object.mode_set(mode=oldMode)
+        remeshModelUpdate(measure, depth, subdivisions, len(ob.data.polygons), time.time()-startTime)
+        
+        helper.modeSet(oldMode)
         
         if dyntopoOn == True:
             bpy.ops.sculpt.dynamic_topology_toggle()
@@ -121,8 +320,177 @@ class RemeshOperator(bpy.types.Operator):
         
 
         
+class BackgroundRemeshOperator(bpy.types.Operator):
+    '''Remesh the active object in a background Blender process, press ESC to cancel'''
+    bl_idname = "sculpt.remesh_background"
+    bl_label = "Background Remesh"
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+    
+    # started from invoke only, a redo would start a second worker
+    def invoke(self, context, event):
+        ob = context.active_object
+        wm = context.window_manager
+        
+        if ob.mode == 'SCULPT' and context.sculpt_object.use_dynamic_topology_sculpting:
+            self.report({'WARNING'}, "Turn off dynamic topology first")
+            return {'CANCELLED'}
+        if ob.data.shape_keys is not None:
+            self.report({'WARNING'}, "Remove the shape keys first, the remeshed mesh can't keep them")
+            return {'CANCELLED'}
+        if ob.mode == 'EDIT':
+            ob.update_from_editmode()
+        
+        self.objName = ob.name
+        # the result replaces the mesh, which must still be the one the worker got
+        self.meshName = ob.data.name
+        self.fingerprint = Freeze.meshFingerprint(ob.data)
+        self.depth, self.subdivisions = remeshSettings(ob, wm)
+        self.measure = remeshMeasure(ob, False)
+        
+        self.jobDir = tempfile.mkdtemp(prefix="sculpt_remesh_")
+        co, loopTotal, loopVerts = helper.meshToArrays(ob.data)
+        np.savez(os.path.join(self.jobDir, 'input.npz'), co=co, loopTotal=loopTotal, loopVerts=loopVerts)
+        
+        workerScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remeshWorker.py')
+        self.worker = subprocess.Popen([bpy.app.binary_path, '-b', '--factory-startup', '--python', workerScript, '--',
+                                        self.jobDir, str(self.depth), str(self.subdivisions), str(remeshScale),
+                                        # the worker projects onto the surface as it was at launch
+                                        '1' if wm.remeshPreserveShape else '0'],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        
+        self.timer = wm.event_timer_add(0.25, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.finish(context)
+            self.report({'INFO'}, "Background remesh cancelled")
+            return {'CANCELLED'}
+        
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        outputPath = os.path.join(self.jobDir, 'output.npz')
+        if self.worker.poll() is None:
+            # the worker writes the share of its stages done and the stage it is in
+            try:
+                with open(os.path.join(self.jobDir, 'progress.txt')) as f:
+                    progress, stage = f.read().split(' ', 1)
+                progress = float(progress)
+            except (IOError, OSError, ValueError):
+                progress, stage = 0.0, "starting"
+            if context.area:
+                context.area.header_text_set("Remeshing %s: %s, %d%%  (ESC to cancel)" % (self.objName, stage, progress*100))
+            return {'PASS_THROUGH'}
+        
+        ob = bpy.data.objects.get(self.objName)
+        # blender exits cleanly even when the script fails, so a missing output is the failure signal
+        if ob is None or not os.path.exists(outputPath):
+            self.finish(context)
+            self.report({'WARNING'}, "Background remesh failed")
+            return {'CANCELLED'}
+        
+        if ob.mode == 'EDIT':
+            ob.update_from_editmode()
+        if ob.data.name != self.meshName or ob.data.shape_keys is not None or Freeze.meshFingerprint(ob.data) != self.fingerprint:
+            self.finish(context)
+            self.report({'WARNING'}, "%s changed while remeshing, the result was dropped" % self.objName)
+            return {'CANCELLED'}
+        
+        result = np.load(outputPath)
+        
+        # the mesh can't be swapped under sculpt or edit mode, only the active object can be in one
+        with helper.ModeState():
+            if ob.mode != 'OBJECT':
+                helper.modeSet('OBJECT')
+                helper.modeFlush()
+            
+            helper.meshFromArrays(ob.data, result['co'], result['loopTotal'], result['loopVerts'])
+        
+        remeshModelUpdate(self.measure, self.depth, self.subdivisions, len(ob.data.polygons), float(result['seconds']))
+        self.finish(context)
+        # the operator has no undo of its own, the step is pushed once the mesh is in
+        bpy.ops.ed.undo_push(message="Background Remesh")
+        return {'FINISHED'}
+    
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        if self.worker.poll() is None:
+            self.worker.terminate()
+            self.worker.wait()
+        shutil.rmtree(self.jobDir, ignore_errors=True)
+        if context.area:
+            context.area.header_text_set()
+        
+# reflection across the YZ plane of the object, the same one the mirror modifier uses with it as mirror object
+def mirrorMatrix(plane):
+    return plane.matrix_world * Matrix.Scale(-1.0, 4, Vector((1.0, 0.0, 0.0))) * plane.matrix_world.inverted()
+
+def mirrorInstances(ob):
+    return [instance for instance in bpy.context.scene.objects if instance.get("xmirrorSource") == ob.name]
+
+# same as the mirror modifier's default merge limit
+mirrorMergeThreshold = 0.001
+
+# A negative scale copy sharing the object's mesh, nothing gets evaluated or stored twice.
+# The copy has no modifiers, it shows the mesh as stored
+def mirrorInstance(ob, plane):
+    md = ob.modifiers.get('xmirror')
+    if md is not None:
+        ob.modifiers.remove(md)
+    
+    instances = mirrorInstances(ob)
+    if instances:
+        instance = instances[0]
+    else:
+        if "XMirror" not in bpy.data.groups:
+            bpy.data.groups.new("XMirror")
+        instance = ob.copy()
+        for md in list(instance.modifiers):
+            instance.modifiers.remove(md)
+        instance.name = ob.name + ".mirror"
+        bpy.context.scene.objects.link(instance)
+        bpy.data.groups['XMirror'].objects.link(instance)
+        instance["xmirrorSource"] = ob.name
+    instance["xmirrorPlane"] = plane.name
+    instance.matrix_world = mirrorMatrix(plane) * ob.matrix_world
+    instance.select = False
+    return instance
+
+def mirrorModifier(ob, plane):
+    for instance in mirrorInstances(ob):
+        bpy.context.scene.objects.unlink(instance)
+        bpy.data.objects.remove(instance)
+    md = ob.modifiers.get('xmirror') or ob.modifiers.new('xmirror', 'MIRROR')
+    md.mirror_object = plane
+
+# bakes the instance into its source's mesh, which ends up like an applied mirror modifier, vertices on the
+# mirror plane are merged with their mirror image the way the modifier does by default
+def mirrorRealize(source, instance):
+    relative = source.matrix_world.inverted() * instance.matrix_world
+    bpy.context.scene.objects.unlink(instance)
+    bpy.data.objects.remove(instance)
+    if source.data.users > 1:
+        source.data = source.data.copy()
+    
+    bm = bmesh.new()
+    bm.from_mesh(source.data)
+    mirrored = bmesh.ops.duplicate(bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:])['geom']
+    bmesh.ops.transform(bm, matrix=relative, verts=[elem for elem in mirrored if isinstance(elem, bmesh.types.BMVert)])
+    bmesh.ops.reverse_faces(bm, faces=[elem for elem in mirrored if isinstance(elem, bmesh.types.BMFace)])
+    onPlane = [v for v in bm.verts if (relative * v.co - v.co).length <= mirrorMergeThreshold]
+    if onPlane:
+        bmesh.ops.remove_doubles(bm, verts=onPlane, dist=mirrorMergeThreshold)
+    bm.to_mesh(source.data)
+    bm.free()
+    source.data.update()
+
 class XMirrorOperator(bpy.types.Operator):
-    '''Applies an X-axis mirror modifier to the selected object. If more objects are selected, they will be mirrored around the active object.'''
+    '''Applies an X-axis mirror modifier to the selected object. If more objects are selected, they will be mirrored around the active object, with a modifier or as mirrored instances.'''
     bl_idname = "boolean.mod_xmirror"
     bl_label = "X-Mirror"
     bl_options = {'REGISTER', 'UNDO'}
@@ -134,37 +502,49 @@ class XMirrorOperator(bpy.types.Operator):
     def execute(self, context):
         activeObj = context.active_object
         if len(bpy.context.selected_objects)>1 :
+            # this works on the data alone, neither the active object nor any mode changes.
+            # Running it again in the other mode swaps modifiers and instances
             for SelectedObject in bpy.context.selected_objects :
-                if SelectedObject != activeObj :
-                    oldMode = SelectedObject.mode    
-
-                    bpy.context.scene.objects.active = SelectedObject
-
-                    bpy.ops.object.mode_set(mode='OBJECT')
-
-                    md = SelectedObject.modifiers.new('xmirror', 'MIRROR')
-                    md.mirror_object = activeObj
-
-
-
-                    bpy.ops.object.mode_set(mode=oldMode)
-                    bpy.context.scene.objects.active = activeObj
+                if SelectedObject != activeObj and "xmirrorSource" not in SelectedObject:
+                    if context.window_manager.xmirrorModeEnum == 'INSTANCE' and SelectedObject.type == 'MESH':
+                        mirrorInstance(SelectedObject, activeObj)
+                    else:
+                        mirrorModifier(SelectedObject, activeObj)
                     
         #if there's only one object selected, apply straight fo the active obj.
         if len(bpy.context.selected_objects)==1 :
+            with helper.ModeState():
+                helper.modeSet('OBJECT')
 
-            oldMode = activeObj.mode    
-
-            bpy.ops.object.mode_set(mode='OBJECT')
-
-            md = activeObj.modifiers.new('xmirror', 'MIRROR')
+                md = activeObj.modifiers.new('xmirror', 'MIRROR')
 
-            bpy.ops.object.modifier_apply(apply_as='DATA', modifier=md.name)
-
-            bpy.ops.object.mode_set(mode=oldMode)
+                helper.modifierApply(md.name)
                 
         return {'FINISHED'}
 
+class XMirrorRealizeOperator(bpy.types.Operator):
+    '''Bakes the mirrored instances of the selected objects into their meshes'''
+    bl_idname = "boolean.xmirror_realize"
+    bl_label = "Realize X-Mirror"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.mode == 'OBJECT'
+    
+    def execute(self, context):
+        pairs = {}
+        for SelectedObject in bpy.context.selected_objects :
+            source = bpy.data.objects.get(SelectedObject.get("xmirrorSource", ""))
+            if source is not None:
+                pairs[SelectedObject.name] = (source, SelectedObject)
+            for instance in mirrorInstances(SelectedObject):
+                pairs[instance.name] = (SelectedObject, instance)
+        
+        for source, instance in pairs.values():
+            mirrorRealize(source, instance)
+        self.report({'INFO'}, "%d mirrored instances realized" % len(pairs))
+        return {'FINISHED'}
         
 class DoubleSidedOffOperator(bpy.types.Operator):
     '''Turn off double sided for all objects'''
@@ -180,6 +560,75 @@ class DoubleSidedOffOperator(bpy.types.Operator):
             mesh.show_double_sided = False
         return {'FINISHED'}
 
+# Mirrors a half mesh across the plane of the axis and joins both halves. The vertices within threshold of
+# the plane are snapped onto it and welded among themselves, nothing else is merged. loopData and faceData
+# are per loop and per face arrays that come along. Returns the same arrays for the whole mesh
+def symmetrizeArrays(co, loopTotal, loopVerts, loopData, faceData, axis, threshold):
+    vertCount = len(co)
+    loopStart = np.zeros(len(loopTotal), dtype=np.int32)
+    np.cumsum(loopTotal[:-1], out=loopStart[1:])
+    
+    co = co.copy()
+    onPlane = np.abs(co[:, axis]) <= threshold
+    band = np.flatnonzero(onPlane)
+    co[band, axis] = 0.0
+    weld = helper.weldVerts(co, band, threshold)
+    mirrorCo = co.copy()
+    mirrorCo[:, axis] *= -1.0
+    
+    # the mirrored faces run the other way round so their normals point outwards
+    reverse = 2*np.repeat(loopStart, loopTotal) + np.repeat(loopTotal, loopTotal) - 1 - np.arange(len(loopVerts))
+    mirrorVerts = loopVerts[reverse]
+    mirrorVerts = np.where(onPlane[mirrorVerts], weld[mirrorVerts], mirrorVerts + vertCount)
+    # faces lying in the plane would come out twice
+    mirrorFaces = np.minimum.reduceat(onPlane[loopVerts].astype(np.int8), loopStart) == 0
+    mirrorLoops = np.repeat(mirrorFaces, loopTotal)
+    
+    co = np.vstack((co, mirrorCo))
+    loopTotal = np.concatenate((loopTotal, loopTotal[mirrorFaces]))
+    loopVerts = np.concatenate((weld[loopVerts], mirrorVerts[mirrorLoops]))
+    loopData = [np.concatenate((data, data[reverse][mirrorLoops])) for data in loopData]
+    faceData = [np.concatenate((data, data[mirrorFaces])) for data in faceData]
+    
+    # welding can put the same vertex twice in a row
+    co, loopTotal, loopVerts, loopMask, faceMask = helper.meshCollapse(co, loopTotal, loopVerts)
+    loopData = [data[loopMask] for data in loopData]
+    faceData = [data[faceMask] for data in faceData]
+    return co, loopTotal, loopVerts, loopData, faceData
+
+# symmetrize in the mesh's own space, direction is one of the bolsymm items, NEGATIVE_X copies -X onto +X
+def meshSymmetrize(mesh, direction, threshold):
+    axis = 'XYZ'.index(direction[-1])
+    # the normal points at the side that gets replaced
+    normal = Vector((0.0, 0.0, 0.0))
+    normal[axis] = 1.0 if direction.startswith('NEGATIVE') else -1.0
+    
+    bm = bmesh.new()
+    bm.from_mesh(mesh)
+    bmesh.ops.bisect_plane(bm, geom=bm.verts[:]+bm.edges[:]+bm.faces[:], dist=threshold,
+                           plane_co=(0.0, 0.0, 0.0), plane_no=normal, clear_outer=True)
+    half = bpy.data.meshes.new("SymmetrizeHalf")
+    bm.to_mesh(half)
+    bm.free()
+    
+    co, loopTotal, loopVerts = helper.meshToArrays(half)
+    layers = helper.meshLoopLayers(half)
+    smooth = np.empty(len(loopTotal), dtype=np.int32)
+    half.polygons.foreach_get('use_smooth', smooth)
+    materials = np.empty(len(loopTotal), dtype=np.int32)
+    half.polygons.foreach_get('material_index', materials)
+    bpy.data.meshes.remove(half)
+    if len(loopTotal) == 0:
+        return
+    
+    co, loopTotal, loopVerts, loopData, (smooth, materials) = symmetrizeArrays(co, loopTotal, loopVerts,
+        [data for kind, name, data in layers], [smooth, materials], axis, threshold)
+    
+    helper.meshFromArrays(mesh, co, loopTotal, loopVerts)
+    mesh.polygons.foreach_set('use_smooth', smooth)
+    mesh.polygons.foreach_set('material_index', materials)
+    helper.meshSetLoopLayers(mesh, [(kind, name, data) for (kind, name, old), data in zip(layers, loopData)])
+
 class SymmetrizeBoolMesh(bpy.types.Operator):
     """Copies one side of the mesh to the other along the chosen axis"""
     bl_idname = "boolean.grease_symm"
@@ -187,6 +636,10 @@ class SymmetrizeBoolMesh(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
     
     symm_int = bpy.props.FloatProperty(name="Threshold", min = 0.0001, max = 1, default = .001)       
+    method = bpy.props.EnumProperty(name="Method",
+                     items = (("BAND","Seam Band","Mirror the vertices and weld only around the symmetry plane"),
+                              ("OPERATOR","Symmetrize","Symmetrize, then merge doubles over the whole mesh")),
+                     default = "BAND")
     
     @classmethod
     def poll(cls, context):
@@ -195,12 +648,24 @@ class SymmetrizeBoolMesh(bpy.types.Operator):
     def execute(self, context):
         func = bpy.ops
         wm = context.window_manager
-        mode_curr = context.active_object.mode
-        func.object.editmode_toggle()
-        func.mesh.select_all(action='SELECT')
-        func.mesh.symmetrize(direction = wm.bolsymm, threshold= self.symm_int)
-        func.mesh.remove_doubles()
-        func.object.editmode_toggle()
-        if mode_curr == 'VERTEX_PAINT':
-            func.object.mode_set(mode='VERTEX_PAINT')
+        ob = context.active_object
+        method = self.method
+        if len(ob.vertex_groups) > 0 or ob.data.shape_keys is not None:
+            # vertex groups and shape keys don't survive the rebuild
+            method = 'OPERATOR'
+        
+        # goes straight back to vertex paint, without a stop in object mode
+        with helper.ModeState():
+            if method == 'BAND':
+                helper.modeSet('OBJECT')
+                helper.modeFlush()
+                with profiling.stage("symmetrize"):
+                    meshSymmetrize(ob.data, wm.bolsymm, self.symm_int)
+                return {'FINISHED'}
+            
+            helper.modeSet('EDIT')
+            helper.modeFlush()
+            func.mesh.select_all(action='SELECT')
+            func.mesh.symmetrize(direction = wm.bolsymm, threshold= self.symm_int)
+            func.mesh.remove_doubles()
         return {'FINISHED'}
\ No newline at end of file